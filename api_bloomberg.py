@@ -1,34 +1,65 @@
 # Bloomberg 
+import hashlib
+import json
+import os
 import numpy as np
 import pandas as pd
 
-from typing import Dict, List, Optional, Tuple
+from pathlib import Path
+from typing import List, Optional, Tuple
 from logger_config import get_logger
 
 logger = get_logger(__name__)
 
+# Noms blpapi pré-alloués (comparaison par identité dans la boucle d'événements)
+try:
+    import blpapi
+    REFERENCE_DATA_RESPONSE = blpapi.Name("ReferenceDataResponse")
+    RESPONSE_EVENT = blpapi.Event.RESPONSE
+    NUMERIC_TYPES = (blpapi.DataType.FLOAT32, blpapi.DataType.FLOAT64,
+                     blpapi.DataType.INT32, blpapi.DataType.INT64)
+except ImportError:
+    blpapi = None
+
+# Cache disque des réponses Bloomberg
+CACHE_DIR = Path.home() / ".cache" / "bbg"
+CACHE_MAX_ENTRIES = 32
+
+# Nombre maximal de tickers par ReferenceDataRequest
+BATCH_SIZE = 100
+
 
 class BloombergDataFetcher:
     """Gestionnaire optimisé pour les appels Bloomberg API"""
 
-    def __init__(self):
+    def __init__(self, cache_dir: Optional[Path] = None):
         self.session = None
         self.service = None
-        self._initialize_session()
+        self.cache_dir = Path(cache_dir) if cache_dir else CACHE_DIR
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close_session()
+        return False
     
-    def _initialize_session(self):
-        """Initialise la session Bloomberg"""
+    def _ensure_session(self):
+        """Initialise la session Bloomberg au premier appel"""
+        if self.service is not None:
+            return
+        
         try:
             from blpapi import SessionOptions, Session
-            import blpapi
             
             options = SessionOptions()
             options.setServerHost('localhost')
             options.setServerPort(8194)
             
-            self.session = Session(options)
-            if not self.session.start():
+            session = Session(options)
+            if not session.start():
                 raise RuntimeError("Échec du démarrage de la session Bloomberg.")
+            self.session = session
             
             if not self.session.openService("//blp/refdata"):
                 raise RuntimeError("Échec de l'ouverture du service Bloomberg.")
@@ -40,81 +71,156 @@ class BloombergDataFetcher:
             logger.error("Module blpapi non disponible")
             raise
         except Exception as e:
-            logger.error(f"Erreur lors de l'initialisation Bloomberg: {e}")
+            logger.error("Erreur lors de l'initialisation Bloomberg: %s", e)
             raise
     
-    def fetch_batch_data(self, tickers: List[str], fields: List[str]) -> Dict[str, Dict[str, any]]:
+    def fetch_batch_data(self, tickers: List[str], fields: List[str]) -> pd.DataFrame:
         """
-        Récupère les données pour plusieurs tickers en une seule requête
+        Récupère les données pour plusieurs tickers, par lots de BATCH_SIZE
         
         Args:
             tickers: Liste des tickers Bloomberg
             fields: Liste des champs à récupérer
             
         Returns:
-            Dictionnaire {ticker: {field: value}}
+            DataFrame indexé par ticker, une colonne par champ
         """
-        if not self.service or not tickers:
-            return {}
+        # Tickers nettoyés et dédoublonnés, dans l'ordre d'origine
+        tickers = list(dict.fromkeys(
+            str(ticker).strip() for ticker in tickers
+            if pd.notna(ticker) and str(ticker).strip() not in ("", "nan Equity")
+        ))
+        
+        if not tickers:
+            return self._empty_result(fields)
+        
+        cache_path = self._cache_path(tickers, fields)
+        cached = self._read_cache(cache_path)
+        if cached is not None:
+            return cached
+        
+        self._ensure_session()
         
         try:
-            import blpapi
+            records = []
             
-            request = self.service.createRequest("ReferenceDataRequest")
+            # Une requête par lot de BATCH_SIZE tickers, envoyées l'une après l'autre
+            for debut in range(0, len(tickers), BATCH_SIZE):
+                records.extend(self._fetch_chunk(tickers[debut:debut + BATCH_SIZE], fields))
             
-            # Ajouter tous les tickers
-            for ticker in tickers:
-                if ticker and str(ticker).strip():
-                    request.getElement("securities").appendValue(str(ticker).strip())
+            # Conversion unique en DataFrame (dernière réponse retenue par ticker)
+            results = pd.DataFrame.from_records(records, columns=["ticker", *fields]).set_index("ticker")
+            results = results[~results.index.duplicated(keep="last")]
             
-            # Ajouter tous les champs
-            for field in fields:
-                request.getElement("fields").appendValue(field)
-            
-            self.session.sendRequest(request)
+            logger.info("Données récupérées pour %d tickers", len(results))
+            self._write_cache(cache_path, results)
+            return results
             
-            results = {}
+        except Exception as e:
+            logger.error("Erreur lors de la récupération des données Bloomberg: %s", e)
+            return self._empty_result(fields)
+    
+    def _empty_result(self, fields: List[str]) -> pd.DataFrame:
+        """Résultat vide au format de fetch_batch_data"""
+        return pd.DataFrame(columns=["ticker", *fields]).set_index("ticker")
+    
+    def _fetch_chunk(self, tickers: List[str], fields: List[str]) -> List[Tuple]:
+        """Envoie une ReferenceDataRequest pour un lot de tickers et attend la réponse"""
+        request = self.service.createRequest("ReferenceDataRequest")
+        
+        # Ajouter tous les tickers
+        for ticker in tickers:
+            request.getElement("securities").appendValue(ticker)
+        
+        # Ajouter tous les champs
+        for field in fields:
+            request.getElement("fields").appendValue(field)
+        
+        self.session.sendRequest(request)
+        
+        field_names = [blpapi.Name(field) for field in fields]
+        records = []
+        
+        while True:
+            ev = self.session.nextEvent()
             
-            while True:
-                ev = self.session.nextEvent()
-                
-                for msg in ev:
-                    if msg.messageType() == "ReferenceDataResponse":
-                        security_data_array = msg.getElement("securityData")
+            for msg in ev:
+                if msg.messageType() == REFERENCE_DATA_RESPONSE:
+                    security_data_array = msg.getElement("securityData")
+                    
+                    for i in range(security_data_array.numValues()):
+                        security_data = security_data_array.getValueAsElement(i)
+                        ticker = security_data.getElementAsString("security")
                         
-                        for i in range(security_data_array.numValues()):
-                            security_data = security_data_array.getValueAsElement(i)
-                            ticker = security_data.getElementAsString("security")
-                            
-                            results[ticker] = {}
-                            
-                            if security_data.hasElement("fieldData"):
-                                field_data = security_data.getElement("fieldData")
-                                
-                                for field in fields:
-                                    if field_data.hasElement(field):
-                                        try:
-                                            results[ticker][field] = field_data.getElementAsFloat(field)
-                                        except:
-                                            try:
-                                                results[ticker][field] = field_data.getElementAsString(field)
-                                            except:
-                                                results[ticker][field] = None
-                                    else:
-                                        results[ticker][field] = None
-                
-                if ev.eventType() == blpapi.Event.RESPONSE:
-                    break
+                        if security_data.hasElement("fieldData"):
+                            field_data = security_data.getElement("fieldData")
+                            records.append((ticker, *(self._extract_value(field_data, name)
+                                                      for name in field_names)))
+                        else:
+                            records.append((ticker, *([None] * len(field_names))))
             
-            logger.info(f"Données récupérées pour {len(results)} tickers")
-            return results
+            if ev.eventType() == RESPONSE_EVENT:
+                break
+        
+        return records
+    
+    def _extract_value(self, field_data, name) -> any:
+        """Extrait la valeur d'un champ selon son type Bloomberg"""
+        if not field_data.hasElement(name):
+            return None
+        
+        element = field_data.getElement(name)
+        if element.isNull():
+            return None
+        if element.datatype() in NUMERIC_TYPES:
+            return element.getValueAsFloat()
+        return element.getValueAsString()
+    
+    def _cache_path(self, tickers: List[str], fields: List[str]) -> Path:
+        """Chemin du cache pour une requête, valable jusqu'au jour ouvré suivant"""
+        jour_ouvre = pd.offsets.BDay().rollback(pd.Timestamp.today().normalize())
+        cle = json.dumps([sorted(map(str, tickers)), list(fields)])
+        empreinte = hashlib.sha1(cle.encode("utf-8")).hexdigest()
+        return self.cache_dir / f"{jour_ouvre:%Y%m%d}_{empreinte}.parquet"
+    
+    def _read_cache(self, cache_path: Path) -> Optional[pd.DataFrame]:
+        """Lit une réponse en cache, None si absente ou illisible"""
+        if not cache_path.exists():
+            return None
+        
+        try:
+            df = pd.read_parquet(cache_path)
+            os.utime(cache_path)  # Mise à jour de l'ordre LRU
+        except Exception as e:
+            logger.warning("Cache Bloomberg illisible (%s): %s", cache_path.name, e)
+            return None
+        
+        logger.info("Données Bloomberg lues depuis le cache pour %d tickers", len(df))
+        return df
+    
+    def _write_cache(self, cache_path: Path, results: pd.DataFrame):
+        """Écrit une réponse en cache et purge les entrées expirées ou excédentaires"""
+        if results.empty:
+            return
+        
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            results.to_parquet(cache_path)
             
+            # Les entrées d'un jour ouvré précédent sont expirées
+            jour_ouvre = cache_path.name.split("_")[0]
+            entrees = sorted(self.cache_dir.glob("*.parquet"),
+                             key=lambda p: p.stat().st_mtime, reverse=True)
+            for i, entree in enumerate(entrees):
+                if i >= CACHE_MAX_ENTRIES or not entree.name.startswith(jour_ouvre):
+                    entree.unlink(missing_ok=True)
         except Exception as e:
-            logger.error(f"Erreur lors de la récupération des données Bloomberg: {e}")
-            return {}
+            logger.warning("Écriture du cache Bloomberg impossible: %s", e)
     
     def close_session(self):
         """Ferme la session Bloomberg"""
         if self.session:
             self.session.stop()
+            self.session = None
+            self.service = None
             logger.info("Session Bloomberg fermée")
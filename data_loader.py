@@ -1,140 +1,269 @@
 
 from logger_config import get_logger
+from api_bloomberg import BloombergDataFetcher
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain, islice
+import numpy as np
+import openpyxl
+from openpyxl.cell.cell import ERROR_CODES
 import pandas as pd
+from pandas.api.types import union_categoricals
+from pandas.io.parsers import TextParser
+from typing import Dict, List, Optional
 
 #Initialisation du logger (gestion des erreurs)
 logger = get_logger(__name__)
 
+# Chaînes stockées en Arrow (jointures, .str et .isin exécutés hors Python)
+STRING_DTYPE = "string[pyarrow]"
+
 # Charger les donnnees 
 class DataLoader:
     """Gestionnaire de chargement et fusion des données"""
 
     def __init__(self, config: dict):
         self.config = config
+        
+        # Colonnes OVCV conservées
+        self.colonnes_ovcv = [
+            "Ticker", "Security Description", "Trade Date", "Bond Market Price",
+            "Spread (Credit)", "Stock Volatility", "Volatility Spread",
+            "Stock Price", "Bond Recovery (%)", "Borrow Cost (%)",
+            "Future DVD Yield", "E2C Decay", "Greek Calculation Type",
+            "Fair Value", "Implied Spread", "Implied Volatility",
+            "Delta (%)", "Delta (pts)", "Gamma", "Vega", "Theta",
+            "Cheapness (%)", "Soft Call Trigger", "Bond Floor",
+            "Option Value", "Parity", "Premium (pts)", "Premium (%)",
+            "Expected Life (Fugit)", "Interest Sensitivity",
+            "Credit Sensitivity", "Convexity", "Effective Duration",
+            "Yield to Mty", "Yield to Call", "Yield to Put",
+            "Yield to Worst", "Current Yield"
+        ]
+        
+        # Colonnes des ratings internes conservées
+        self.colonnes_ratings = ["ISIN", "Rating", "Rating Date"]
+        
+        # Champs Bloomberg des dates de publication
+        self.champs_bloomberg = ["EXPECTED_REPORT_DT", "EXPECTED_REPORT_TIME"]
 
     
+    def _read_excel(self, path: str, skiprows: int = 0,
+                    usecols: Optional[List[str]] = None,
+                    dtype: Optional[Dict[str, str]] = None,
+                    parse_dates: Optional[List[str]] = None) -> pd.DataFrame:
+        """Lit un fichier Excel avec le moteur calamine (repli sur openpyxl)"""
+        try:
+            return pd.read_excel(path, skiprows=skiprows, usecols=usecols, dtype=dtype,
+                                 parse_dates=parse_dates, engine="calamine")
+        except ImportError:
+            logger.warning("python-calamine non disponible, lecture openpyxl en mode read_only")
+            return self._read_excel_fast(path, skiprows, usecols, dtype, parse_dates)
+    
+    def _read_excel_fast(self, path: str, skiprows: int = 0,
+                         usecols: Optional[List[str]] = None,
+                         dtype: Optional[Dict[str, str]] = None,
+                         parse_dates: Optional[List[str]] = None) -> pd.DataFrame:
+        """Lit la première feuille via openpyxl en mode read_only/data_only"""
+        wb = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            rows = islice(wb.worksheets[0].iter_rows(values_only=True), skiprows, None)
+            header = next(rows, ())
+            
+            # Seules les cellules des colonnes demandées sont matérialisées
+            indices = [i for i, name in enumerate(header) if usecols is None or name in usecols]
+            data = [
+                ["" if row[i] is None or row[i] in ERROR_CODES else row[i] for i in indices]
+                for row in chain([header], rows)
+            ]
+        finally:
+            wb.close()
+        
+        # Suppression des lignes vides en fin de feuille
+        while data and all(value == "" for value in data[-1]):
+            data.pop()
+        
+        # Même conversion que pd.read_excel (en-têtes, valeurs manquantes, types)
+        return TextParser(data, header=0, dtype=dtype, parse_dates=parse_dates).read()
+    
     def load_portfolio_data(self) -> pd.DataFrame:
         """Charge et fusionne toutes les données du portefeuille"""
         logger.info("Début du chargement des données")
         
-        # Chargement des données principales
-        df_port = self._load_portfolio_file()
-        df_themes = self._load_themes_file()
-        df_data = self._load_ovcv_data()
-        df_ratings = self._load_internal_ratings()
-        
-        # Fusion des données
-        df_merged = self._merge_all_data(df_port, df_themes, df_data, df_ratings)
+        # Chargement des données principales (lectures Excel en parallèle)
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            future_port = executor.submit(self._load_portfolio_file)
+            futures = [
+                executor.submit(self._load_themes_file),
+                executor.submit(self._load_ovcv_data),
+                executor.submit(self._load_internal_ratings),
+            ]
+            
+            # Requête Bloomberg lancée dès le portefeuille chargé, pendant les autres lectures
+            future_bbg = None
+            if self.config['settings'].get('bloomberg_earnings', 0):
+                future_bbg = executor.submit(self._fetch_bloomberg_data, future_port.result())
+            
+            df_port = future_port.result()
+            df_themes, df_data, df_ratings = (f.result() for f in futures)
+            
+            # Fusion des données
+            df_merged = self._merge_all_data(df_port, df_themes, df_data, df_ratings)
+            
+            # Enrichissement Bloomberg (attente de la réponse seulement ici)
+            if future_bbg is not None:
+                df_merged = self._enrich_with_bloomberg_data(df_merged, future_bbg.result())
         
         return df_merged
     
     def _load_portfolio_file(self) -> pd.DataFrame:
         """Charge le fichier principal du portefeuille"""
         try:
-            df = pd.read_excel(self.config['files']['portfolio'], skiprows=3)
-            logger.info(f"Fichier portefeuille chargé: {len(df)} lignes")
+            dtype = {"ISIN": STRING_DTYPE, "Security Type": STRING_DTYPE,
+                     "Eqty Ticker": STRING_DTYPE, "S&P": STRING_DTYPE,
+                     **self.config.get('dtype_hints', {}).get('portfolio', {})}
+            df = self._read_excel(self.config['files']['portfolio'], skiprows=3, dtype=dtype)
+            logger.info("Fichier portefeuille chargé: %d lignes", len(df))
             return df
         except Exception as e:
-            logger.error(f"Erreur chargement portefeuille: {e}")
+            logger.error("Erreur chargement portefeuille: %s", e)
             raise
     
     def _load_themes_file(self) -> pd.DataFrame:
         """Charge le fichier des thématiques"""
         try:
-            df = pd.read_excel(self.config['files']['themes'])
-            logger.info(f"Fichier thématiques chargé: {len(df)} lignes")
+            df = self._read_excel(self.config['files']['themes'], usecols=["ISIN", "Theme"],
+                                  dtype={"ISIN": STRING_DTYPE, "Theme": STRING_DTYPE})
+            logger.info("Fichier thématiques chargé: %d lignes", len(df))
             return df
         except Exception as e:
-            logger.error(f"Erreur chargement thématiques: {e}")
+            logger.error("Erreur chargement thématiques: %s", e)
             raise
     
     def _load_ovcv_data(self) -> pd.DataFrame:
         """Charge les données OVCV"""
         try:
-            df = pd.read_excel(self.config['files']['ovcv_data'], skiprows=6)
+            df = self._read_excel(self.config['files']['ovcv_data'], skiprows=6,
+                                  usecols=self.colonnes_ovcv,
+                                  dtype={"Ticker": STRING_DTYPE, "Security Description": STRING_DTYPE},
+                                  parse_dates=["Trade Date"])
+            df = df[self.colonnes_ovcv]
+            df["ISIN"] = df["Ticker"].str.slice(0, -5)
             
-            # Colonnes à conserver
-            colonnes_a_garder = [
-                "Ticker", "Security Description", "Trade Date", "Bond Market Price",
-                "Spread (Credit)", "Stock Volatility", "Volatility Spread",
-                "Stock Price", "Bond Recovery (%)", "Borrow Cost (%)",
-                "Future DVD Yield", "E2C Decay", "Greek Calculation Type",
-                "Fair Value", "Implied Spread", "Implied Volatility",
-                "Delta (%)", "Delta (pts)", "Gamma", "Vega", "Theta",
-                "Cheapness (%)", "Soft Call Trigger", "Bond Floor",
-                "Option Value", "Parity", "Premium (pts)", "Premium (%)",
-                "Expected Life (Fugit)", "Interest Sensitivity",
-                "Credit Sensitivity", "Convexity", "Effective Duration",
-                "Yield to Mty", "Yield to Call", "Yield to Put",
-                "Yield to Worst", "Current Yield"
-            ]
-            
-            df = df[colonnes_a_garder]
-            df["ISIN"] = df["Ticker"].str[:-5]
-            
-            logger.info(f"Données OVCV chargées: {len(df)} lignes")
+            logger.info("Données OVCV chargées: %d lignes", len(df))
             return df
             
         except Exception as e:
-            logger.error(f"Erreur chargement OVCV: {e}")
+            logger.error("Erreur chargement OVCV: %s", e)
             raise
     
     def _load_internal_ratings(self) -> pd.DataFrame:
         """Charge les ratings internes"""
         try:
-            df = pd.read_excel(self.config['files']['internal_ratings'])
-            df = df[["ISIN", "Rating", 'Rating Date']]
+            df = self._read_excel(self.config['files']['internal_ratings'],
+                                  usecols=self.colonnes_ratings,
+                                  dtype={"ISIN": STRING_DTYPE, "Rating": "category"})
+            df = df[self.colonnes_ratings]
             df["Rating Date"] = pd.to_datetime(df["Rating Date"], errors="coerce")
             df = df.sort_values("Rating Date").drop_duplicates("ISIN", keep="last")
             
-            logger.info(f"Ratings internes chargés: {len(df)} lignes")
+            logger.info("Ratings internes chargés: %d lignes", len(df))
             return df
             
         except Exception as e:
-            logger.error(f"Erreur chargement ratings: {e}")
+            logger.error("Erreur chargement ratings: %s", e)
             raise
     
     def _merge_all_data(self, df_port: pd.DataFrame, df_themes: pd.DataFrame, 
                        df_data: pd.DataFrame, df_ratings: pd.DataFrame) -> pd.DataFrame:
-        """Fusionne toutes les données"""
+        """Fusionne toutes les données
+        
+        Seules les colonnes utiles sont jointes au portefeuille :
+        - thématiques : Theme
+        - OVCV : self.colonnes_ovcv (les calculs utilisent Delta (%), Premium (%),
+          Effective Duration, Interest Sensitivity, Credit Sensitivity et
+          Implied Spread ; les autres colonnes alimentent la vue détaillée)
+        - ratings internes : Rating, Rating Date
+        """
         logger.info("Début de la fusion des données")
         
-        # Fusion avec les thématiques
-        df_merged = df_port.merge(
-            df_themes[["ISIN", "Theme"]],
-            on="ISIN",
-            how="left"
-        )
+        # Projection des colonnes utiles avant les jointures
+        df_themes = df_themes[["ISIN", "Theme"]]
+        df_data = df_data[["ISIN"] + self.colonnes_ovcv]
+        df_ratings = df_ratings[self.colonnes_ratings]
         
-        # Fusion avec les données OVCV
-        df_merged = df_merged.merge(
-            df_data,
-            on="ISIN",
-            how="left",
-            suffixes=("", "_XCV")
+        # Clés ISIN en catégories communes : les jointures hachent des codes entiers
+        isin_categories = union_categoricals([
+            pd.Categorical(df["ISIN"].dropna())
+            for df in (df_port, df_themes, df_data, df_ratings)
+        ]).categories
+        df_port, df_themes, df_data, df_ratings = (
+            df.assign(ISIN=pd.Categorical(df["ISIN"], categories=isin_categories))
+            for df in (df_port, df_themes, df_data, df_ratings)
         )
         
-        # Fusion avec les ratings internes
-        df_merged = df_merged.merge(
-            df_ratings,
-            on="ISIN",
-            how="left",
-            suffixes=("", "_Interne")
+        # Index ISIN construit une fois par table puis réutilisé par les jointures
+        df_themes = df_themes.set_index("ISIN")
+        df_data = df_data.set_index("ISIN")
+        df_ratings = df_ratings.set_index("ISIN")
+        
+        # Suffixes des colonnes en collision (équivalent des suffixes de merge)
+        colonnes = set(df_port.columns) | set(df_themes.columns)
+        df_data = df_data.rename(columns={c: f"{c}_XCV" for c in df_data.columns if c in colonnes})
+        colonnes |= set(df_data.columns)
+        df_ratings = df_ratings.rename(columns={c: f"{c}_Interne" for c in df_ratings.columns if c in colonnes})
+        
+        # Jointure avec les thématiques, les données OVCV et les ratings internes
+        df_merged = (
+            df_port.set_index("ISIN")
+            .join([df_themes, df_data, df_ratings], how="left")
+            .reset_index()
         )
         
+        # ISIN reprend sa position d'origine
+        df_merged.insert(df_port.columns.get_loc("ISIN"), "ISIN", df_merged.pop("ISIN"))
+        
         # Création du S&P ajusté
         df_merged["S&P Ajusted"] = df_merged["S&P"].fillna(df_merged["Rating"])
         
         logger.info("Fusion des données terminée")
         return df_merged
     
- 
+    def _fetch_bloomberg_data(self, df_port: pd.DataFrame) -> pd.DataFrame:
+        """Récupère les dates de publication des sous-jacents des convertibles"""
+        mask_convertible = df_port["Security Type"] == "Convertible Bonds"
+        tickers = (df_port.loc[mask_convertible, "Eqty Ticker"].dropna().astype(STRING_DTYPE)
+                   + " Equity").unique()
+        
+        try:
+            with BloombergDataFetcher() as fetcher:
+                return fetcher.fetch_batch_data(tickers, self.champs_bloomberg)
+        except Exception as e:
+            logger.error("Bloomberg indisponible, dates de publication ignorées: %s", e)
+            return pd.DataFrame(columns=self.champs_bloomberg)
+    
+    def _enrich_with_bloomberg_data(self, df: pd.DataFrame,
+                                    bloomberg_data: pd.DataFrame) -> pd.DataFrame:
+        """Ajoute les dates de publication Bloomberg des sous-jacents des convertibles"""
+        mask_convertible = df["Security Type"] == "Convertible Bonds"
+        
+        # Aucune convertible : colonnes vides, sans jointure ni construction d'EARNING
+        if not mask_convertible.any():
+            for colonne in self.champs_bloomberg + ["EARNING"]:
+                df[colonne] = np.nan
+            return df
+        
+        tickers = (df["Eqty Ticker"].astype(STRING_DTYPE) + " Equity").where(mask_convertible)
+        
+        # Jointure unique sur l'index ticker du résultat Bloomberg
+        df = df.join(bloomberg_data.reindex(tickers)[self.champs_bloomberg].set_axis(df.index))
+        
+        df["EARNING"] = self._create_earning_column(df)
+        return df
     
-    def _create_earning_column(self, row) -> str:
+    def _create_earning_column(self, df: pd.DataFrame) -> pd.Series:
         """Crée la colonne EARNING combinant date et heure"""
-        if (pd.notna(row['EXPECTED_REPORT_TIME']) 
-            and str(row['EXPECTED_REPORT_TIME']).strip().upper() != "#N/A N/A"
-            and str(row['EXPECTED_REPORT_TIME']).strip() != ""):
-            return f"{row['EXPECTED_REPORT_DT']} {row['EXPECTED_REPORT_TIME']}"
-        else:
-            return f"{row['EXPECTED_REPORT_DT']}"
+        # Nettoyage unique de l'heure, réutilisé pour le masque et la concaténation
+        heure = df['EXPECTED_REPORT_TIME'].astype(STRING_DTYPE).str.strip()
+        heure_valide = heure.notna() & (heure.str.upper() != "#N/A N/A") & (heure != "")
+        date = df['EXPECTED_REPORT_DT'].astype(STRING_DTYPE)
+        return (date + " " + heure).where(heure_valide, date)
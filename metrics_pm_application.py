@@ -1,6 +1,7 @@
 # streamlit_app.py
 import streamlit as st
 import pandas as pd
+import numpy as np
 from datetime import datetime
 import logging
 import plotly.express as px
@@ -23,14 +24,200 @@ st.set_page_config(
     layout="wide"
 )
 
+# Columns offered as sidebar filters, with their labels
+FILTER_COLUMNS = {
+    "Security Type": "Security Type:",
+    "Industry Sector": "Industry Sector:",
+    "REGION": "Region:",
+    "Theme": "Theme:",
+    "SENSI BUCKET": "Sensi Bucket:",
+    "Vol_Bucket": "Vol Bucket:",
+    "Maturity_Bucket": "Maturity Bucket:",
+    "Credit Category": "Credit Category:",
+    "S&P Ajusted": "Rating:",
+    "Style": "Style:"
+}
+
+# Fixed width of the static metric tables (capped to their column)
+TABLE_WIDTH = 800
+
+# Rows rendered in the detailed data table unless "Show all rows" is ticked
+DETAIL_ROW_LIMIT = 500
+
+# Metrics tab layout: header, then one (subheader, result key, chart title,
+# label column, value column, chart kind, chart options) entry per section
+SECTIONS = [
+    ("🏆 Top Holdings", [
+        ("Top 10 by Market Value", "top_10_holdings", "Top 10 Holdings",
+         "Short Name", "Market Value (%)", "barh", dict(show_text=True)),
+        ("Top 10 Equity Contributors", "top_10_contrib_equity", "Top 10 Equity Contributors",
+         "Short Name", "CONTRIB SENSI EQUITY", "barh", dict(colorscale='Blues', show_text=True)),
+    ]),
+    ("📊 Allocations", [
+        ("By Sector", "contrib_by_sector", "Contribution by Sector",
+         "Industry Sector", "CONTRIB SENSI EQUITY", "bar", dict(colorscale='Viridis', tickangle=-45)),
+        ("By Region", "contrib_by_region", "Allocation by Region",
+         "REGION", "CONTRIB SENSI EQUITY", "pie", dict()),
+        ("By Theme", "contrib_by_theme", "Contribution by Theme",
+         "Theme", "CONTRIB SENSI EQUITY", "bar", dict(colorscale='Teal', tickangle=-45)),
+        ("By Style", "contrib_by_style", "Allocation by Style",
+         "Style", "CONTRIB SENSI EQUITY", "pie", dict(hole=0.3)),
+    ]),
+    ("📦 Bucket Analysis", [
+        ("Sensitivity Buckets", "contrib_by_sensi_bucket", "Distribution by Sensitivity Bucket",
+         "SENSI BUCKET", "Total_Contrib", "bar", dict(colorscale='RdYlGn', show_text=True)),
+        ("Volatility Buckets", "contrib_by_vol_bucket", "Distribution by Volatility",
+         "Vol_Bucket", "Total_Contrib", "bar", dict(colorscale='Reds', show_text=True)),
+    ]),
+    ("💳 Credit Analysis", [
+        ("By Category (IG/HY/Cash)", "credit_analysis.by_category", "IG/HY/Cash Allocation",
+         "Credit Category", "Market_Value", "pie",
+         dict(colors=px.colors.qualitative.Set2, textinfo='percent+label')),
+        ("By S&P Rating", "credit_analysis.by_rating", "Allocation by Rating",
+         "S&P Ajusted", "Market_Value", "bar", dict(colorscale='RdYlGn_r', show_text=True, tickangle=-45)),
+        ("Top 10 Issuers", "credit_analysis.by_issuer", "Top 10 Issuers",
+         "Issuer", "Market Value (%)", "barh", dict(colorscale='Blues', show_text=True)),
+        ("By Maturity", "credit_analysis.by_maturity", "Allocation by Maturity",
+         "Maturity_Bucket", "Market_Value", "bar", dict(colorscale='Purples', show_text=True)),
+    ]),
+]
+
+# Custom orders for ordered axes
+CUSTOM_ORDER = {
+    "SENSI BUCKET": ["Bucket 0-25", "Bucket 25-50", "Bucket 50-75", "Bucket 75-100"],
+    "Vol_Bucket": ["<20%", "20-30%", "30-40%", ">40%"],
+    "Maturity_Bucket": ["<1 An", "1 à 3 Ans", "3 à 5 Ans", ">5 Ans"],
+    "S&P Ajusted": ["AAA", "AA+", "AA", "AA-", 
+                    "A+", "A", "A-", 
+                    "BBB+", "BBB", "BBB-", 
+                    "BB+", "BB", "BB-", 
+                    "B+", "B", "B-", 
+                    "CCC+", "CCC", "CCC-", 
+                    "CC", "C", "D", 
+                    "NR", "CASH"]
+}
+
+
+def to_category(series, order=None):
+    """Convert a column to category dtype, ordered when a custom order exists"""
+    if order is None:
+        return series.astype("category")
+    extra = sorted(set(series.dropna().unique()) - set(order))
+    return series.astype(pd.CategoricalDtype(order + extra, ordered=True))
+
+
+# Analyzer shared by reference across reruns and sessions (never pickled)
+@st.cache_resource
+def get_analyzer(config_path: str):
+    """Create the portfolio analyzer once per config file"""
+    return PortfolioAnalyzer(config_path)
+
+
 # Cache for data
 @st.cache_data(ttl=3600)
 def load_and_analyze_portfolio(config_path: str):
     """Load and analyze portfolio"""
     logger.info("Loading data...")
-    analyzer = PortfolioAnalyzer(config_path)
+    analyzer = get_analyzer(config_path)
     results = analyzer.run_full_analysis()
-    return results, analyzer.df, analyzer.df_complete
+    
+    # Repeated filter/grouping columns stored as categories, on new frames
+    # so the shared analyzer is left untouched
+    df, df_complete = (
+        frame.assign(**{col: to_category(frame[col], CUSTOM_ORDER.get(col)) for col in FILTER_COLUMNS})
+        for frame in (analyzer.df, analyzer.df_complete)
+    )
+    
+    return results, df, df_complete
+
+
+@st.cache_data(ttl=3600)
+def get_filter_options(df):
+    """Values present in each filter column, read from the category metadata"""
+    return {col: df[col].cat.remove_unused_categories().cat.categories.tolist()
+            for col in FILTER_COLUMNS}
+
+
+@st.cache_data(ttl=3600)
+def aggregate(df, value_x, value_y, value_stack=None):
+    """Sum value_y by value_x (and value_stack), cached per selection"""
+    keys = [value_x] if value_stack is None else [value_x, value_stack]
+    return df.groupby(keys, observed=True, sort=False)[value_y].sum()
+
+
+def bar_figure(labels, values, title, label_name, value_name, horizontal=False,
+               colorscale=None, show_text=False, tickangle=None, height=400):
+    """Bar chart built directly with graph_objects from label/value arrays"""
+    marker = None
+    if colorscale is not None:
+        marker = dict(color=values, colorscale=colorscale, showscale=True,
+                      colorbar=dict(title=value_name))
+    fig = go.Figure(go.Bar(
+        x=values if horizontal else labels,
+        y=labels if horizontal else values,
+        orientation='h' if horizontal else 'v',
+        marker=marker,
+        text=values if show_text else None,
+        texttemplate='%{text:.2f}%' if show_text else None,
+        textposition='outside' if show_text else None
+    ))
+    fig.update_layout(
+        title=title,
+        height=height,
+        showlegend=False,
+        xaxis_title=value_name if horizontal else label_name,
+        yaxis_title=label_name if horizontal else value_name
+    )
+    if horizontal:
+        fig.update_layout(yaxis={'categoryorder': 'total ascending'})
+    if tickangle is not None:
+        fig.update_layout(xaxis_tickangle=tickangle)
+    return fig
+
+
+def pie_figure(labels, values, title, hole=0, colors=None, textinfo=None, height=400):
+    """Pie chart built directly with graph_objects from label/value arrays"""
+    fig = go.Figure(go.Pie(
+        labels=labels,
+        values=values,
+        hole=hole,
+        marker=dict(colors=colors) if colors is not None else None
+    ))
+    if textinfo is not None:
+        fig.update_traces(textposition='inside', textinfo=textinfo)
+    fig.update_layout(title=title, height=height)
+    return fig
+
+
+def render_section(data, subheader, title, label_name, value_name, kind, options):
+    """Render one "table left / chart right" block of the metrics tab"""
+    st.subheader(subheader)
+    col1, col2 = st.columns([2, 3])
+    
+    with col1:
+        st.dataframe(
+            data['df'],
+            width=TABLE_WIDTH,
+            hide_index=True,
+            height=400
+        )
+    
+    with col2:
+        if kind == 'pie':
+            fig = pie_figure(data['labels'], data['values'], title=title, **options)
+        else:
+            fig = bar_figure(
+                data['labels'],
+                data['values'],
+                title=title,
+                label_name=label_name,
+                value_name=value_name,
+                horizontal=(kind == 'barh'),
+                **options
+            )
+        st.plotly_chart(fig, use_container_width=True)
+    
+    st.divider()
 
 
 def main():
@@ -93,410 +280,54 @@ def display_portfolio_metrics(results, df_filtered, df_complete):
     
     st.divider()
     
-    # Top Holdings
-    st.header("🏆 Top Holdings")
-    
-    # Top 10 by Market Value
-    st.subheader("Top 10 by Market Value")
-    col1, col2 = st.columns([2, 3])
-    
-    with col1:
-        df_top10 = results['top_10_holdings'].iloc[:-1]  # Exclude TOTAL row
-        st.dataframe(
-            results['top_10_holdings'],
-            use_container_width=True,
-            hide_index=True,
-            height=400
-        )
-    
-    with col2:
-        fig = px.bar(
-            df_top10,
-            y='Short Name',
-            x='Market Value (%)',
-            orientation='h',
-            title="Top 10 Holdings",
-            text='Market Value (%)'
-        )
-        fig.update_traces(texttemplate='%{text:.2f}%', textposition='outside')
-        fig.update_layout(height=400, showlegend=False, yaxis={'categoryorder':'total ascending'})
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.divider()
-    
-    # Top 10 Equity Contributors
-    st.subheader("Top 10 Equity Contributors")
-    col1, col2 = st.columns([2, 3])
-    
-    with col1:
-        df_contrib = results['top_10_contrib_equity'].iloc[:-1]  # Exclude TOTAL row
-        st.dataframe(
-            results['top_10_contrib_equity'],
-            use_container_width=True,
-            hide_index=True,
-            height=400
-        )
-    
-    with col2:
-        fig = px.bar(
-            df_contrib,
-            y='Short Name',
-            x='CONTRIB SENSI EQUITY',
-            orientation='h',
-            title="Top 10 Equity Contributors",
-            text='CONTRIB SENSI EQUITY',
-            color='CONTRIB SENSI EQUITY',
-            color_continuous_scale='Blues'
-        )
-        fig.update_traces(texttemplate='%{text:.2f}%', textposition='outside')
-        fig.update_layout(height=400, showlegend=False, yaxis={'categoryorder':'total ascending'})
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.divider()
-    
-    # Allocations by categories
-    st.header("📊 Allocations")
-    
-    # By Sector
-    st.subheader("By Sector")
-    col1, col2 = st.columns([2, 3])
-    
-    with col1:
-        st.dataframe(
-            results['contrib_by_sector'],
-            use_container_width=True,
-            hide_index=True,
-            height=400
-        )
-    
-    with col2:
-        fig = px.bar(
-            results['contrib_by_sector'],
-            x='Industry Sector',
-            y='CONTRIB SENSI EQUITY',
-            title="Contribution by Sector",
-            color='CONTRIB SENSI EQUITY',
-            color_continuous_scale='Viridis'
-        )
-        fig.update_layout(height=400, showlegend=False, xaxis_tickangle=-45)
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.divider()
-    
-    # By Region
-    st.subheader("By Region")
-    col1, col2 = st.columns([2, 3])
-    
-    with col1:
-        st.dataframe(
-            results['contrib_by_region'],
-            use_container_width=True,
-            hide_index=True,
-            height=400
-        )
-    
-    with col2:
-        fig = px.pie(
-            results['contrib_by_region'],
-            values='CONTRIB SENSI EQUITY',
-            names='REGION',
-            title="Allocation by Region"
-        )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.divider()
-    
-    # By Theme
-    st.subheader("By Theme")
-    col1, col2 = st.columns([2, 3])
-    
-    with col1:
-        st.dataframe(
-            results['contrib_by_theme'],
-            use_container_width=True,
-            hide_index=True,
-            height=400
-        )
-    
-    with col2:
-        fig = px.bar(
-            results['contrib_by_theme'],
-            x='Theme',
-            y='CONTRIB SENSI EQUITY',
-            title="Contribution by Theme",
-            color='CONTRIB SENSI EQUITY',
-            color_continuous_scale='Teal'
-        )
-        fig.update_layout(height=400, showlegend=False, xaxis_tickangle=-45, )
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.divider()
-    
-    # By Style
-    st.subheader("By Style")
-    col1, col2 = st.columns([2, 3])
-    
-    with col1:
-        st.dataframe(
-            results['contrib_by_style'],
-            use_container_width=True,
-            hide_index=True,
-            height=400
-        )
-    
-    with col2:
-        fig = px.pie(
-            results['contrib_by_style'],
-            values='CONTRIB SENSI EQUITY',
-            names='Style',
-            title="Allocation by Style",
-            hole=0.3
-        )
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.divider()
-    
-    # Buckets
-    st.header("📦 Bucket Analysis")
-    
-    # Sensi Buckets
-    st.subheader("Sensitivity Buckets")
-    col1, col2 = st.columns([2, 3])
-    
-    with col1:
-        st.dataframe(
-            results['contrib_by_sensi_bucket'],
-            use_container_width=True,
-            hide_index=True,
-            height=400
-        )
-    
-    with col2:
-        # Custom order for buckets
-        ordre_sensi = ["Bucket 0-25", "Bucket 25-50", "Bucket 50-75", "Bucket 75-100"]
-        df_sensi = results['contrib_by_sensi_bucket'].copy()
-        df_sensi['SENSI BUCKET'] = pd.Categorical(
-            df_sensi['SENSI BUCKET'],
-            categories=ordre_sensi,
-            ordered=True
-        )
-        df_sensi = df_sensi.sort_values('SENSI BUCKET')
-        
-        fig = px.bar(
-            df_sensi,
-            x='SENSI BUCKET',
-            y='Total_Contrib',
-            title="Distribution by Sensitivity Bucket",
-            text='Total_Contrib',
-            color='Total_Contrib',
-            color_continuous_scale='RdYlGn'
-        )
-        fig.update_traces(texttemplate='%{text:.2f}%', textposition='outside')
-        fig.update_layout(height=400, showlegend=False)
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.divider()
-    
-    # Volatility Buckets
-    st.subheader("Volatility Buckets")
-    col1, col2 = st.columns([2, 3])
-    
-    with col1:
-        st.dataframe(
-            results['contrib_by_vol_bucket'],
-            use_container_width=True,
-            hide_index=True,
-            height=400
-        )
-    
-    with col2:
-        # Custom order for volatility
-        ordre_vol = ["<20%", "20-30%", "30-40%", ">40%"]
-        df_vol = results['contrib_by_vol_bucket'].copy()
-        df_vol['Vol_Bucket'] = pd.Categorical(
-            df_vol['Vol_Bucket'],
-            categories=ordre_vol,
-            ordered=True
-        )
-        df_vol = df_vol.sort_values('Vol_Bucket')
-        
-        fig = px.bar(
-            df_vol,
-            x='Vol_Bucket',
-            y='Total_Contrib',
-            title="Distribution by Volatility",
-            text='Total_Contrib',
-            color='Total_Contrib',
-            color_continuous_scale='Reds'
-        )
-        fig.update_traces(texttemplate='%{text:.2f}%', textposition='outside')
-        fig.update_layout(height=400, showlegend=False)
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.divider()
-    
-    # Credit Analysis
-    st.header("💳 Credit Analysis")
+    # Table / chart sections
+    for header, sections in SECTIONS:
+        st.header(header)
+        for subheader, key, title, label_name, value_name, kind, options in sections:
+            data = results
+            for part in key.split('.'):
+                data = data[part]
+            render_section(data, subheader, title, label_name, value_name, kind, options)
     
     credit_analysis = results['credit_analysis']
     
-    # By Category (IG/HY/Cash)
-    st.subheader("By Category (IG/HY/Cash)")
-    col1, col2 = st.columns([2, 3])
-    
-    with col1:
-        st.dataframe(
-            credit_analysis['by_category'],
-            use_container_width=True,
-            hide_index=True,
-            height=400
-        )
-    
-    with col2:
-        fig = px.pie(
-            credit_analysis['by_category'],
-            values='Market_Value',
-            names='Credit Category',
-            title="IG/HY/Cash Allocation",
-            color_discrete_sequence=px.colors.qualitative.Set2
-        )
-        fig.update_traces(textposition='inside', textinfo='percent+label')
-        fig.update_layout(height=400)
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.divider()
-    
-    # By S&P Rating
-    st.subheader("By S&P Rating")
-    col1, col2 = st.columns([2, 3])
-    
-    with col1:
-        st.dataframe(
-            credit_analysis['by_rating'],
-            use_container_width=True,
-            hide_index=True,
-            height=400
-        )
-    
-    with col2:
-        fig = px.bar(
-            credit_analysis['by_rating'],
-            x='S&P Ajusted',
-            y='Market_Value',
-            title="Allocation by Rating",
-            text='Market_Value',
-            color='Market_Value',
-            color_continuous_scale='RdYlGn_r'
-        )
-        fig.update_traces(texttemplate='%{text:.2f}%', textposition='outside')
-        fig.update_layout(height=400, showlegend=False, xaxis_tickangle=-45)
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.divider()
-    
-    # Top 10 Issuers
-    st.subheader("Top 10 Issuers")
-    col1, col2 = st.columns([2, 3])
-    
-    with col1:
-        st.dataframe(
-            credit_analysis['by_issuer'],
-            use_container_width=True,
-            hide_index=True,
-            height=400
-        )
-    
-    with col2:
-        fig = px.bar(
-            credit_analysis['by_issuer'],
-            y='Issuer',
-            x='Market Value (%)',
-            orientation='h',
-            title="Top 10 Issuers",
-            text='Market Value (%)',
-            color='Market Value (%)',
-            color_continuous_scale='Blues'
-        )
-        fig.update_traces(texttemplate='%{text:.2f}%', textposition='outside')
-        fig.update_layout(height=400, showlegend=False, yaxis={'categoryorder':'total ascending'})
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.divider()
-    
-    # By Maturity
-    st.subheader("By Maturity")
-    col1, col2 = st.columns([2, 3])
-    
-    with col1:
-        st.dataframe(
-            credit_analysis['by_maturity'],
-            use_container_width=True,
-            hide_index=True,
-            height=400
-        )
-    
-    with col2:
-        # Custom order for maturity
-        ordre_mat = ["<1 An", "1 à 3 Ans", "3 à 5 Ans", ">5 Ans"]
-        df_mat = credit_analysis['by_maturity'].copy()
-        df_mat['Maturity_Bucket'] = pd.Categorical(
-            df_mat['Maturity_Bucket'],
-            categories=ordre_mat,
-            ordered=True
-        )
-        df_mat = df_mat.sort_values('Maturity_Bucket')
-        
-        fig = px.bar(
-            df_mat,
-            x='Maturity_Bucket',
-            y='Market_Value',
-            title="Allocation by Maturity",
-            text='Market_Value',
-            color='Market_Value',
-            color_continuous_scale='Purples'
-        )
-        fig.update_traces(texttemplate='%{text:.2f}%', textposition='outside')
-        fig.update_layout(height=400, showlegend=False)
-        st.plotly_chart(fig, use_container_width=True)
-    
-    st.divider()
-    
     # Detailed view Maturity x Rating (Heatmap)
     st.subheader("Detailed View: Maturity x Rating")
     
-    # Create heatmap
-    df_heatmap = credit_analysis['by_maturity_rating'].pivot_table(
-        index='S&P Ajusted',
-        columns='Maturity_Bucket',
-        values='Market_Value',
-        fill_value=0
+    # Create heatmap: both axes are ordered categoricals, so rows and columns
+    # come out in rating and maturity order
+    df_heatmap = (
+        credit_analysis['by_maturity_rating']
+        .groupby(['S&P Ajusted', 'Maturity_Bucket'], observed=True)['Market_Value']
+        .sum()
+        .unstack(fill_value=0)
     )
     
-    # Reorder columns
-    ordre_mat = ["<1 An", "1 à 3 Ans", "3 à 5 Ans", ">5 Ans"]
-    df_heatmap = df_heatmap.reindex(columns=[col for col in ordre_mat if col in df_heatmap.columns])
-    
     col1, col2 = st.columns([2, 3])
     
     with col1:
         st.dataframe(
             credit_analysis['by_maturity_rating'],
-            use_container_width=True,
+            width=TABLE_WIDTH,
             hide_index=True,
             height=500
         )
     
     with col2:
-        fig = px.imshow(
-            df_heatmap,
-            labels=dict(x="Maturity", y="Rating", color="Market Value (%)"),
+        fig = go.Figure(go.Heatmap(
+            z=df_heatmap.to_numpy(),
+            x=df_heatmap.columns.to_numpy(),
+            y=df_heatmap.index.to_numpy(),
+            colorscale='YlOrRd',
+            colorbar=dict(title="Market Value (%)")
+        ))
+        fig.update_layout(
             title="Heatmap Maturity x Rating",
-            color_continuous_scale='YlOrRd',
-            aspect="auto"
+            height=500,
+            xaxis_title="Maturity",
+            yaxis_title="Rating",
+            yaxis_autorange='reversed'
         )
-        fig.update_layout(height=500)
         st.plotly_chart(fig, use_container_width=True)
     
     st.divider()
@@ -509,6 +340,7 @@ def display_portfolio_metrics(results, df_filtered, df_complete):
         )
 
 
+@st.fragment
 def display_interactive_charts(DF_DYN_CONV_PORT):
     """Display interactive charts with filters"""
     
@@ -518,104 +350,31 @@ def display_interactive_charts(DF_DYN_CONV_PORT):
     # Option to enable/disable filters
     enable_filters = st.sidebar.checkbox("Enable filters", value=False)
 
-    # Initialize filtered dataframe
-    df_filtered = DF_DYN_CONV_PORT.copy()
-
     # Conditional filters
     if enable_filters:
-        df_filter_working = DF_DYN_CONV_PORT.copy()
-
-        security_types = st.sidebar.multiselect(
-            "Security Type:",
-            options=list(DF_DYN_CONV_PORT["Security Type"].dropna().unique())
-        )
-
-        industry_sectors = st.sidebar.multiselect(
-            "Industry Sector:",
-            options=list(DF_DYN_CONV_PORT["Industry Sector"].dropna().unique())
-        )
-
-        region = st.sidebar.multiselect(
-            "Region:",
-            options=list(DF_DYN_CONV_PORT["REGION"].dropna().unique())
-        )
-
-        theme = st.sidebar.multiselect(
-            "Theme:",
-            options=list(DF_DYN_CONV_PORT["Theme"].dropna().unique())
-        )
-
-        sensi_bucket = st.sidebar.multiselect(
-            "Sensi Bucket:",
-            options=list(DF_DYN_CONV_PORT["SENSI BUCKET"].dropna().unique())
-        )
-
-        vol_bucket = st.sidebar.multiselect(
-            "Vol Bucket:",
-            options=list(DF_DYN_CONV_PORT["Vol_Bucket"].dropna().unique())
-        )
-
-        maturity_bucket = st.sidebar.multiselect(
-            "Maturity Bucket:",
-            options=list(DF_DYN_CONV_PORT["Maturity_Bucket"].dropna().unique())
-        )
-
-        credit_category = st.sidebar.multiselect(
-            "Credit Category:",
-            options=list(DF_DYN_CONV_PORT["Credit Category"].dropna().unique())
-        )
-
-        rating = st.sidebar.multiselect(
-            "Rating:",
-            options=list(DF_DYN_CONV_PORT["S&P Ajusted"].dropna().unique())
-        )
-
-        style = st.sidebar.multiselect(
-            "Style:",
-            options=list(DF_DYN_CONV_PORT["Style"].dropna().unique())
-        )
-       
-        # Apply filters
-        if security_types:
-            df_filter_working = df_filter_working[df_filter_working["Security Type"].isin(security_types)]
-        if industry_sectors:
-            df_filter_working = df_filter_working[df_filter_working["Industry Sector"].isin(industry_sectors)]
-        if region:
-            df_filter_working = df_filter_working[df_filter_working["REGION"].isin(region)]
-        if theme:
-            df_filter_working = df_filter_working[df_filter_working["Theme"].isin(theme)]
-        if sensi_bucket:
-            df_filter_working = df_filter_working[df_filter_working["SENSI BUCKET"].isin(sensi_bucket)]
-        if vol_bucket:
-            df_filter_working = df_filter_working[df_filter_working["Vol_Bucket"].isin(vol_bucket)]
-        if maturity_bucket:
-            df_filter_working = df_filter_working[df_filter_working["Maturity_Bucket"].isin(maturity_bucket)]
-        if credit_category:
-            df_filter_working = df_filter_working[df_filter_working["Credit Category"].isin(credit_category)]
-        if rating:
-            df_filter_working = df_filter_working[df_filter_working["S&P Ajusted"].isin(rating)]
-        if style:
-            df_filter_working = df_filter_working[df_filter_working["Style"].isin(style)]
-            
-        df_filtered = df_filter_working.copy()
+        filter_options = get_filter_options(DF_DYN_CONV_PORT)
+        active_filters = []
+        for col, label in FILTER_COLUMNS.items():
+            selected = st.sidebar.multiselect(label, options=filter_options[col])
+            if selected:
+                active_filters.append((col, selected))
+
+        # Apply filters with a single combined mask
+        mask = np.ones(len(DF_DYN_CONV_PORT), dtype=bool)
+        for col, selected in active_filters:
+            mask &= DF_DYN_CONV_PORT[col].isin(selected).to_numpy()
+        df_filtered = DF_DYN_CONV_PORT[mask] if active_filters else DF_DYN_CONV_PORT
     else:
-        df_filtered = DF_DYN_CONV_PORT.copy()
+        df_filtered = DF_DYN_CONV_PORT
 
-    # Sort
+    # Sort (applied to the detailed table only, the charts sort their aggregates)
     st.sidebar.header("🔄 Sort Settings")
+    sort_ascending = {"Market Value (%)": False, "CONTRIB SENSI EQUITY": False, "Expected Life (Fugit)": True}
     sort_order = st.sidebar.selectbox(
         "Sort by:",
-        ["No sorting", "Market Value (%)", "CONTRIB SENSI EQUITY", "Expected Life (Fugit)"]
+        ["No sorting", *sort_ascending]
     )
 
-    if sort_order == "Market Value (%)":
-        df_filtered = df_filtered.sort_values("Market Value (%)", ascending=False)
-    elif sort_order == "CONTRIB SENSI EQUITY":
-        df_filtered = df_filtered.sort_values("CONTRIB SENSI EQUITY", ascending=False)
-    elif sort_order == "Expected Life (Fugit)":
-        df_filtered = df_filtered.sort_values("Expected Life (Fugit)", ascending=True)
-
-
     st.header("Visualizations")
     
     st.sidebar.header("📊 Chart Settings")
@@ -643,171 +402,140 @@ def display_interactive_charts(DF_DYN_CONV_PORT):
 
     st.subheader(f"{value_y} by {value_x}")
 
-    # Define custom orders for axes
-    custom_order = {
-        "SENSI BUCKET": ["Bucket 0-25", "Bucket 25-50", "Bucket 50-75", "Bucket 75-100"],
-        "Vol_Bucket": ["<20%", "20-30%", "30-40%", ">40%"],
-        "Maturity_Bucket": ["<1 An", "1 à 3 Ans", "3 à 5 Ans", ">5 Ans"],
-        "S&P Ajusted": ["AAA", "AA+", "AA", "AA-", 
-                    "A+", "A", "A-", 
-                    "BBB+", "BBB", "BBB-", 
-                    "BB+", "BB", "BB-", 
-                    "B+", "B", "B-", 
-                    "CCC+", "CCC", "CCC-", 
-                    "CC", "C", "D", 
-                    "NR", "CASH"]
-    }
+    # Validate the axis selection before aggregating
+    if value_x not in df_filtered.columns or value_y not in df_filtered.columns:
+        st.error(f"❌ Column not available: {value_x} / {value_y}")
+        return
 
-    try:
-        # Aggregate data
-        df_graph = df_filtered.groupby(value_x)[value_y].sum()
-        
-        # Apply custom order if available
-        if value_x in custom_order:
-            present_categories = [cat for cat in custom_order[value_x] if cat in df_graph.index]
-            df_graph = df_graph.reindex(present_categories).dropna()
+    # Aggregate data
+    df_graph = aggregate(df_filtered, value_x, value_y)
+    
+    # Apply custom order if available
+    if value_x in CUSTOM_ORDER:
+        present_categories = [cat for cat in CUSTOM_ORDER[value_x] if cat in df_graph.index]
+        df_graph = df_graph.reindex(present_categories).dropna()
+    else:
+        df_graph = df_graph.sort_values(ascending=False)
+    
+    # Calculate number of lines per category
+    df_count = df_filtered[value_x].value_counts(sort=False).reindex(df_graph.index, fill_value=0)
+    
+    # Create summary table
+    df_recap = pd.DataFrame({
+        value_x: df_graph.index.to_numpy(),
+        value_y: df_graph.to_numpy(),
+        "Number of lines": df_count.to_numpy()
+    }, copy=False)
+    
+    # Layout in 2 columns
+    col1, col2 = st.columns([2, 3])
+    
+    with col1:
+        st.markdown("<h4 style='text-align: center;'>Summary Table</h4>", unsafe_allow_html=True)
+        st.dataframe(
+            df_recap,
+            use_container_width=True,
+            height=500,
+            column_config={
+                value_y: st.column_config.NumberColumn(
+                    value_y,
+                    format="%.2f"
+                ),
+                "Number of lines": st.column_config.NumberColumn(
+                    "Number of lines",
+                    format="%d"
+                )
+            }
+        )
+    
+    with col2:
+        if chart_type == "Stacked Bar" and value_stack == "None":
+            st.warning("⚠️ Please select a stack parameter")
+        elif chart_type == "Stacked Bar" and value_stack == value_x:
+            st.warning("⚠️ Please select a stack parameter different from the grouping")
         else:
-            df_graph = df_graph.sort_values(ascending=False)
-        
-        # Calculate number of lines per category
-        df_count = df_filtered.groupby(value_x).size()
-        df_count = df_count.reindex(df_graph.index).fillna(0).astype(int)
-        
-        # Create summary table
-        df_recap = pd.DataFrame({
-            value_x: df_graph.index,
-            value_y: df_graph.values,
-            "Number of lines": df_count.values
-        })
-        
-        # Layout in 2 columns
-        col1, col2 = st.columns([2, 3])
-        
-        with col1:
-            st.markdown("<h4 style='text-align: center;'>Summary Table</h4>", unsafe_allow_html=True)
-            st.dataframe(
-                df_recap,
-                use_container_width=True,
-                height=500,
-                column_config={
-                    value_y: st.column_config.NumberColumn(
-                        value_y,
-                        format="%.2f"
-                    ),
-                    "Number of lines": st.column_config.NumberColumn(
-                        "Number of lines",
-                        format="%d"
-                    )
-                }
-            )
-        
-        with col2:
-            if chart_type == "Stacked Bar" and value_stack == "None":
-                st.warning("⚠️ Please select a stack parameter")
-            else:
-                if chart_type == "Pie":
-                    fig = px.pie(
-                        values=df_graph.values,
-                        names=df_graph.index,
-                        title=f"{value_y} by {value_x}"
-                    )
-                    fig.update_layout(title_x=0.30, height=500)
-                    st.plotly_chart(fig, use_container_width=True)
+            if chart_type == "Pie":
+                fig = pie_figure(
+                    df_graph.index.to_numpy(),
+                    df_graph.to_numpy(),
+                    title=f"{value_y} by {value_x}",
+                    height=500
+                )
+                fig.update_layout(title_x=0.30)
+                st.plotly_chart(fig, use_container_width=True)
+            
+            elif chart_type == "Bar":
+                fig = bar_figure(
+                    df_graph.index.to_numpy(),
+                    df_graph.to_numpy(),
+                    title=f"{value_y} by {value_x}",
+                    label_name=value_x,
+                    value_name=value_y,
+                    height=500
+                )
                 
-                elif chart_type == "Bar":
-                    df_bar = pd.DataFrame({
-                        value_x: df_graph.index,
-                        value_y: df_graph.values
-                    })
-                    
-                    fig = px.bar(
-                        df_bar,
-                        x=value_x,
-                        y=value_y,
-                        title=f"{value_y} by {value_x}"
-                    )
-                    
-                    if value_x in custom_order:
-                        present_categories = [cat for cat in custom_order[value_x] if cat in df_graph.index]
-                        fig.update_xaxes(categoryorder='array', categoryarray=present_categories)
-                    
-                    fig.update_layout(title_x=0.30, height=500)
-                    st.plotly_chart(fig, use_container_width=True)
+                if value_x in CUSTOM_ORDER:
+                    fig.update_xaxes(categoryorder='array', categoryarray=present_categories)
                 
-                elif chart_type == "Barh":
-                    df_barh = pd.DataFrame({
-                        value_x: df_graph.index[::-1],
-                        value_y: df_graph.values[::-1]
-                    })
-                    
-                    fig = px.bar(
-                        df_barh,
-                        x=value_y,
-                        y=value_x,
-                        orientation='h',
-                        title=f"{value_y} by {value_x}"
-                    )
-                    
-                    if value_x in custom_order:
-                        present_categories = [cat for cat in custom_order[value_x] if cat in df_graph.index]
-                        fig.update_yaxes(categoryorder='array', categoryarray=present_categories[::-1])
-                    
-                    fig.update_layout(title_x=0.30, height=500)
-                    st.plotly_chart(fig, use_container_width=True)
+                fig.update_layout(title_x=0.30)
+                st.plotly_chart(fig, use_container_width=True)
+            
+            elif chart_type == "Barh":
+                fig = bar_figure(
+                    df_graph.index.to_numpy()[::-1],
+                    df_graph.to_numpy()[::-1],
+                    title=f"{value_y} by {value_x}",
+                    label_name=value_x,
+                    value_name=value_y,
+                    horizontal=True,
+                    height=500
+                )
                 
-                elif chart_type == "Stacked Bar":
-                    df_stacked = df_filtered.groupby([value_x, value_stack])[value_y].sum().reset_index()
-                    
-                    if value_x in custom_order:
-                        present_categories = [cat for cat in custom_order[value_x] 
-                                            if cat in df_stacked[value_x].unique()]
-                        df_stacked[value_x] = pd.Categorical(
-                            df_stacked[value_x],
-                            categories=present_categories,
-                            ordered=True
-                        )
-                    
-                    if value_stack in custom_order:
-                        stack_categories = [cat for cat in custom_order[value_stack] 
-                                        if cat in df_stacked[value_stack].unique()]
-                        df_stacked[value_stack] = pd.Categorical(
-                            df_stacked[value_stack],
-                            categories=stack_categories,
-                            ordered=True
-                        )
-                    
-                    df_stacked = df_stacked.sort_values([value_x, value_stack])
-                    
-                    fig = px.bar(
-                        df_stacked,
-                        x=value_x,
-                        y=value_y,
-                        color=value_stack,
-                        title=f"{value_y} by {value_x} (stacked by {value_stack})"
-                    )
-                    
-                    fig.update_layout(title_x=0.5, height=500)
-                    st.plotly_chart(fig, use_container_width=True)
-
-                elif chart_type == "Squarify":
-                    fig = px.treemap(
-                        names=df_graph.index,
-                        parents=[""] * len(df_graph),
-                        values=df_graph.values,
-                        title=f"{value_y} by {value_x}"
-                    )
-                    fig.update_layout(title_x=0.30, height=500)
-                    st.plotly_chart(fig, use_container_width=True)
+                if value_x in CUSTOM_ORDER:
+                    fig.update_yaxes(categoryorder='array', categoryarray=present_categories[::-1])
+                
+                fig.update_layout(title_x=0.30)
+                st.plotly_chart(fig, use_container_width=True)
+            
+            elif chart_type == "Stacked Bar":
+                df_stacked = aggregate(df_filtered, value_x, value_y, value_stack).reset_index()
+                
+                # Ordered categories sort in their custom order
+                df_stacked = df_stacked.sort_values([value_x, value_stack])
+                
+                fig = px.bar(
+                    df_stacked,
+                    x=value_x,
+                    y=value_y,
+                    color=value_stack,
+                    title=f"{value_y} by {value_x} (stacked by {value_stack})"
+                )
+                
+                fig.update_layout(title_x=0.5, height=500)
+                st.plotly_chart(fig, use_container_width=True)
+
+            elif chart_type == "Squarify":
+                fig = go.Figure(go.Treemap(
+                    labels=df_graph.index.to_numpy(),
+                    parents=np.full(len(df_graph), "", dtype=object),
+                    values=df_graph.to_numpy()
+                ))
+                fig.update_layout(title=f"{value_y} by {value_x}", title_x=0.30, height=500)
+                st.plotly_chart(fig, use_container_width=True)
 
-    except Exception as e:
-        st.error(f"❌ Error creating chart: {str(e)}")
-        logger.error(f"Chart error: {e}", exc_info=True)
 
     st.divider()
     
     # Filtered data table
     st.subheader("📋 Detailed Data")
-    st.dataframe(df_filtered, use_container_width=True)
+    if sort_order in sort_ascending:
+        df_filtered = df_filtered.sort_values(sort_order, ascending=sort_ascending[sort_order])
+    show_all_rows = st.checkbox("Show all rows", value=False)
+    if show_all_rows or len(df_filtered) <= DETAIL_ROW_LIMIT:
+        st.dataframe(df_filtered, use_container_width=True)
+    else:
+        st.caption(f"Showing the first {DETAIL_ROW_LIMIT} of {len(df_filtered)} rows")
+        st.dataframe(df_filtered.head(DETAIL_ROW_LIMIT), use_container_width=True)
 
 
 if __name__ == "__main__":
@@ -1,4 +1,5 @@
 from logger_config import get_logger
+import numpy as np
 import pandas as pd
 import configparser
 from data_loader import DataLoader
@@ -6,10 +7,56 @@ from portfolio_calculator import PortfolioCalculator
 from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 import os
+import functools
+from concurrent.futures import ThreadPoolExecutor
 
 #Initialisation du logger (gestion des erreurs)
 logger = get_logger(__name__)
 
+# Dossier du script, résolu une seule fois à l'import
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+@functools.cache
+def _default_config() -> dict:
+    """Configuration par défaut, construite une seule fois (partagée, ne pas modifier)"""
+    return {
+        'files': {
+            'portfolio': os.path.join(SCRIPT_DIR, "DYN_CONV_PORT.xlsx"),
+            'themes': os.path.join(SCRIPT_DIR, "SPDR Thematique.xlsx"),
+            'ovcv_data': os.path.join(SCRIPT_DIR, "XCV_DYN_CONV_DATA_ONLY.xlsm"),
+            'internal_ratings': os.path.join(SCRIPT_DIR, "Rating_Interne.xlsx")
+        },
+        'output': {
+            'dir': SCRIPT_DIR,
+            'images_dir': SCRIPT_DIR
+        },
+        'settings': {
+            'fx_hedge_usd': 2.0, # passer en API later
+            'top_holdings': 10,
+            'bloomberg_earnings': 0 # 1 pour ajouter les dates de publication Bloomberg
+        },
+        'dtype_hints': {
+            # Types imposés à la lecture du portefeuille (colonnes de faible cardinalité en catégories)
+            'portfolio': {
+                "Security Type": "category",
+                "Industry Sector": "category",
+                "Cntry (Risk)": "string[pyarrow]"
+            }
+        }
+    }
+
+# Métriques principales : clé du résultat -> colonne sommée
+SOMMES_PRINCIPALES = {
+    'contrib_equity_sensi': "CONTRIB SENSI EQUITY",
+    'contrib_equity_sensi_xcv': "CONTRIB SENSI EQUITY XCV",
+    'contrib_duration': "OAD [cntr]",
+    'contrib_taux_sensi': "contrib_taux_sensi",
+    'contrib_credit_sensi': "contrib_credit_sensi",
+    'modified_duration': "contrib_modified_duration",
+    'effective_duration': "contrib_effective_duration",
+    'credit_spread': "contrib_implied_spread",
+}
+
 class PortfolioAnalyzer:
     """Analyseur principal du portefeuille"""
     
@@ -21,25 +68,9 @@ class PortfolioAnalyzer:
     
     def _load_config(self, config_path: str) -> dict:
         """Charge la configuration depuis un fichier INI"""
-        script_dir = os.path.dirname(os.path.abspath(__file__))
         if not Path(config_path).exists():
             # Configuration par défaut si le fichier n'existe pas
-            return {
-                'files': {
-                    'portfolio': os.path.join(script_dir,"DYN_CONV_PORT.xlsx"),
-                    'themes': os.path.join(script_dir,"SPDR Thematique.xlsx"),
-                    'ovcv_data': os.path.join(script_dir,"XCV_DYN_CONV_DATA_ONLY.xlsm"),
-                    'internal_ratings': os.path.join(script_dir, "Rating_Interne.xlsx")
-                },
-                'output': {
-                    'dir': script_dir,
-                    'images_dir': script_dir
-                },
-                'settings': {
-                    'fx_hedge_usd': 2.0, # passer en API later
-                    'top_holdings': 10
-                }
-            }
+            return _default_config()
         
         config = configparser.ConfigParser()
         config.read(config_path)
@@ -47,7 +78,8 @@ class PortfolioAnalyzer:
             'files': dict(config['files']),
             'output': dict(config['output']),
             'settings': {k: float(v) if k == 'fx_hedge_usd' else int(v) 
-                        for k, v in config['settings'].items()}
+                        for k, v in config['settings'].items()},
+            'dtype_hints': _default_config()['dtype_hints']
         }
     
     def run_full_analysis(self) -> Dict[str, any]:
@@ -60,13 +92,17 @@ class PortfolioAnalyzer:
             self.df = self.calculator.calculate_all_metrics(self.df)
             
             
-            # Sauvegarder le DataFrame complet AVANT filtrage pour l'allocation par type d'actif
-            self.df_complete = self.df.copy()
+            # DataFrame complet AVANT filtrage pour l'allocation par type d'actif
+            # (référence sans copie : il n'est plus modifié après les calculs)
+            self.df_complete = self.df
+            types = self.df_complete["Security Type"]
             
+            # Périmètre crédit (Corporate Bonds, Convertible Bonds et Cash) repéré par un masque
+            self._credit_mask = types.isin(["Corporate Bonds", "Convertible Bonds", "Cash"]).to_numpy()
             
             # Filtrage des types de securities
             types_autorises = ["Convertible Bonds", "Common Stocks", "Warrants"]  
-            self.df = self.df[self.df["Security Type"].isin(types_autorises)]
+            self.df = self.df_complete[types.isin(types_autorises).to_numpy()]
            
             
             # Calculs des métriques agrégées
@@ -85,98 +121,122 @@ class PortfolioAnalyzer:
         """Calcule toutes les métriques agrégées"""
         results = {}
         
-        # Métriques principales
+        # Métriques principales (sommes des contributions en une seule réduction)
         results['holding'] = self.df["Security Type"].count()
-        results['contrib_equity_sensi'] = self.df["CONTRIB SENSI EQUITY"].sum()
-        results['contrib_equity_sensi_xcv'] = self.df["CONTRIB SENSI EQUITY XCV"].sum()
+        sommes = self.df[list(SOMMES_PRINCIPALES.values())].sum()
+        results.update({cle: sommes[colonne] for cle, colonne in SOMMES_PRINCIPALES.items()})
         results['premium'] = (self.df["% Prem"] * self.df["Market Value (%)"] / 100).sum()
-        results['contrib_duration'] = self.df["OAD [cntr]"].sum()
-        results['contrib_taux_sensi'] = self.df["contrib_taux_sensi"].sum()
-        results['contrib_credit_sensi'] = self.df["contrib_credit_sensi"].sum()
-        results['modified_duration'] = self.df["contrib_modified_duration"].sum()
-        results['effective_duration'] = self.df["contrib_effective_duration"].sum()
-        results['credit_analysis'] = self._calculate_credit_metrics()
-        results['credit_spread'] = self.df["contrib_implied_spread"].sum()
-
-        results['credit_analysis'] = self._calculate_credit_metrics()       
          
         # Rating final calculé par le PortfolioCalculator
         results['rating'] = self.calculator.rating_final
         
+        # Graphiques : (clé, agrégation, colonne label, colonne valeur, ligne TOTAL exclue)
+        graphiques = [
+            # Top holdings
+            ('top_10_holdings', self._get_top_holdings, "Short Name", "Market Value (%)", True),
+            ('top_10_contrib_equity', self._get_top_contributors, "Short Name", "CONTRIB SENSI EQUITY", True),
+            # Agrégations par secteur/région/thème/style
+            ('contrib_by_sector', self._aggregate_by_sector, "Industry Sector", "CONTRIB SENSI EQUITY", False),
+            ('contrib_by_region', self._aggregate_by_region, "REGION", "CONTRIB SENSI EQUITY", False),
+            ('contrib_by_theme', self._aggregate_by_theme, "Theme", "CONTRIB SENSI EQUITY", False),
+            ('contrib_by_style', self._aggregate_by_style, "Style", "CONTRIB SENSI EQUITY", False),
+            # Buckets
+            ('contrib_by_sensi_bucket', self._aggregate_by_sensi_bucket, "SENSI BUCKET", "Total_Contrib", False),
+            ('contrib_by_vol_bucket', self._aggregate_by_vol_bucket, "Vol_Bucket", "Total_Contrib", False),
+        ]
         
-        # Top holdings
-        results['top_10_holdings'] = self._get_top_holdings()
-        results['top_10_contrib_equity'] = self._get_top_contributors()
+        # Colonne de contribution extraite une fois pour les agrégations par dimension
+        self._contrib_equity = self.df["CONTRIB SENSI EQUITY"].to_numpy(dtype=float)
         
-        # Agrégations par secteur/région/thème/style
-        results['contrib_by_sector'] = self._aggregate_by_sector()
-        results['contrib_by_region'] = self._aggregate_by_region()
-        results['contrib_by_theme'] = self._aggregate_by_theme()
-        results['contrib_by_style'] = self._aggregate_by_style()
-       
-        # Buckets
-        results['contrib_by_sensi_bucket'] = self._aggregate_by_sensi_bucket()
-        results['contrib_by_vol_bucket'] = self._aggregate_by_vol_bucket()
-        results['contrib_by_theme_name'] = self._aggregate_by_theme_name()
+        # Agrégations indépendantes en parallèle (lecture seule de self.df)
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            future_credit = executor.submit(self._calculate_credit_metrics)
+            future_theme_name = executor.submit(self._aggregate_by_theme_name)
+            futures = [(cle, executor.submit(agregation), label, valeur, sans_total)
+                       for cle, agregation, label, valeur, sans_total in graphiques]
+            
+            results['credit_analysis'] = future_credit.result()
+            for cle, future, label, valeur, sans_total in futures:
+                results[cle] = self._preparer_graphique(future.result(), label, valeur, sans_total)
+            results['contrib_by_theme_name'] = future_theme_name.result()
         
         return results
     
+    @staticmethod
+    def _preparer_graphique(df: pd.DataFrame, colonne_label: str, colonne_valeur: str,
+                            sans_total: bool = False) -> Dict[str, any]:
+        """Associe au tableau les tableaux numpy labels/valeurs des graphiques"""
+        df_graphique = df.iloc[:-1] if sans_total else df
+        return {
+            'labels': df_graphique[colonne_label].to_numpy(),
+            'values': df_graphique[colonne_valeur].to_numpy(),
+            'df': df
+        }
+    
+    def _top_k(self, df: pd.DataFrame, colonne_valeur: str) -> pd.DataFrame:
+        """Retourne les N plus grandes valeurs de la colonne suivies d'une ligne TOTAL"""
+        valeurs = df[colonne_valeur].to_numpy(dtype=float)
+        k = self.config['settings']['top_holdings']
+        manquant = np.isnan(valeurs)
+        positions = np.flatnonzero(~manquant)
+        
+        # Sélection partielle des k plus grandes valeurs (ex aequo : premières lignes gardées),
+        # seules ces k lignes sont ensuite triées
+        if 0 < k < len(positions):
+            seuil = -np.partition(-valeurs[positions], k - 1)[k - 1]
+            au_dessus = positions[valeurs[positions] > seuil]
+            egaux = positions[valeurs[positions] == seuil][:k - len(au_dessus)]
+            positions = np.concatenate([au_dessus, egaux])
+        positions = positions[np.lexsort((positions, -valeurs[positions]))][:k]
+        
+        # Valeurs manquantes en dernier, comme nlargest, si le top n'est pas complet
+        if len(positions) < k:
+            positions = np.concatenate([positions, np.flatnonzero(manquant)[:k - len(positions)]])
+        
+        top = df.iloc[positions][["Long Name", "Short Name", colonne_valeur]].reset_index(drop=True)
+        
+        # Ajouter le total
+        top.loc[len(top)] = ["TOTAL", "", np.nansum(valeurs[positions])]
+        
+        return top.round(2)
+    
     def _get_top_holdings(self) -> pd.DataFrame:
         """Retourne le top 10 des holdings"""
         types_autorises = ["Convertible Bonds", "Corporate Bonds", "Open-End Funds", 
                           "Warrants", "Common Stocks"]
         df_filtered = self.df[self.df["Security Type"].isin(types_autorises)]
         
-        top_10 = df_filtered.nlargest(self.config['settings']['top_holdings'], 
-                                     "Market Value (%)")[["Long Name", "Short Name", "Market Value (%)"]]
-        
-        # Ajouter le total
-        total_row = pd.DataFrame({
-            "Long Name": ["TOTAL"],
-            "Short Name": [""],
-            "Market Value (%)": [top_10["Market Value (%)"].sum()]
-        })
-        
-        return pd.concat([top_10, total_row], ignore_index=True).round(2)
+        return self._top_k(df_filtered, "Market Value (%)")
     
     def _get_top_contributors(self) -> pd.DataFrame:
         """Retourne le top 10 des contributeurs equity"""
-        top_10 = self.df.nlargest(self.config['settings']['top_holdings'], 
-                                 "CONTRIB SENSI EQUITY")[["Long Name", "Short Name", "CONTRIB SENSI EQUITY"]]
-        
-        # Ajouter le total
-        total_row = pd.DataFrame({
-            "Long Name": ["TOTAL"],
-            "Short Name": [""],
-            "CONTRIB SENSI EQUITY": [top_10["CONTRIB SENSI EQUITY"].sum()],
-            #"EARNING": [""]
-        })
-        
-        return pd.concat([top_10, total_row], ignore_index=True).round(2)
+        return self._top_k(self.df, "CONTRIB SENSI EQUITY")
+    
+    def _agg_sum(self, colonne: str) -> pd.DataFrame:
+        """Somme des contributions equity par modalité de la colonne (factorize + bincount)"""
+        codes, modalites = pd.factorize(self.df[colonne], sort=True)
+        renseigne = codes >= 0
+        totaux = np.bincount(codes[renseigne], weights=self._contrib_equity[renseigne],
+                             minlength=len(modalites))
+        return (pd.DataFrame({colonne: modalites, "CONTRIB SENSI EQUITY": totaux})
+                .round(2)
+                .sort_values("CONTRIB SENSI EQUITY", ascending=False))
     
     def _aggregate_by_sector(self) -> pd.DataFrame:
         """Agrège par secteur"""
-        return (self.df.groupby("Industry Sector")["CONTRIB SENSI EQUITY"]
-                .sum().reset_index().round(2)
-                .sort_values("CONTRIB SENSI EQUITY", ascending=False))
+        return self._agg_sum("Industry Sector")
     
     def _aggregate_by_region(self) -> pd.DataFrame:
         """Agrège par région"""
-        return (self.df.groupby("REGION")["CONTRIB SENSI EQUITY"]
-                .sum().reset_index().round(2)
-                .sort_values("CONTRIB SENSI EQUITY", ascending=False))
+        return self._agg_sum("REGION")
     
     def _aggregate_by_theme(self) -> pd.DataFrame:
         """Agrège par thème"""
-        return (self.df.groupby("Theme")["CONTRIB SENSI EQUITY"]
-                .sum().reset_index().round(2)
-                .sort_values("CONTRIB SENSI EQUITY", ascending=False))
+        return self._agg_sum("Theme")
 
     def _aggregate_by_style(self) -> pd.DataFrame:
-        """Agrège par thème"""
-        return (self.df.groupby("Style")["CONTRIB SENSI EQUITY"]
-                .sum().reset_index().round(2)
-                .sort_values("CONTRIB SENSI EQUITY", ascending=False))
+        """Agrège par style"""
+        return self._agg_sum("Style")
     
     
     def _aggregate_by_sensi_bucket(self) -> pd.DataFrame:
@@ -197,33 +257,32 @@ class PortfolioAnalyzer:
    
     def _aggregate_by_theme_name(self) -> pd.DataFrame:
         """Agrège par thème et nom"""
-        # Filtrer les lignes avec contrib > 0.5
-        filtre = self.df["CONTRIB SENSI EQUITY"] > 1
+        # Filtrer les lignes avec contrib > 1 et un thème renseigné
+        filtre = (self.df["CONTRIB SENSI EQUITY"] > 1) & self.df["Theme"].notna()
         df_filtre = self.df[filtre]
-    
+        
+        # Un seul tri global (thème, puis contribution décroissante) au lieu d'un tri par groupe
         return (
-            df_filtre.groupby('Theme')[["Short Name", "CONTRIB SENSI EQUITY"]]
-            .apply(lambda g: g.sort_values(
-                by="CONTRIB SENSI EQUITY", ascending=False
-            ))
+            df_filtre.sort_values(["Theme", "CONTRIB SENSI EQUITY"], ascending=[True, False], kind="stable")
+            [["Theme", "Short Name", "CONTRIB SENSI EQUITY"]]
+            .set_index("Theme", append=True)
+            .swaplevel()
             .round(2)
-           )
+        )
                 
-    def _calculate_credit_metrics(self) -> Dict[str, pd.DataFrame]:
+    def _calculate_credit_metrics(self) -> Dict[str, any]:
         """Calcule les métriques d'analyse crédit"""
         credit_results = {}
         
         # MODIFIÉ : Utiliser df_complete pour inclure Corporate Bonds et Cash
         # qui ont été exclus du self.df filtré
-        df_credit = self.df_complete[
-            self.df_complete["Security Type"].isin(["Corporate Bonds", "Convertible Bonds", "Cash"])
-        ].copy()
+        df_credit = self.df_complete[self._credit_mask]
         
         logger.info(f"Analyse crédit sur {len(df_credit)} lignes incluant Corporate Bonds, Convertible Bonds et Cash")
         
         # 1. Poids par catégorie IG/HY/Cash
         credit_results['by_category'] = (
-            df_credit.groupby("Credit Category")
+            df_credit.groupby("Credit Category", observed=True)
             .agg(
                 Market_Value=('Market Value (%)', 'sum'),
                 Number_of_positions=('Market Value (%)', 'count')
@@ -234,8 +293,9 @@ class PortfolioAnalyzer:
         
         # 2. Poids par rating détaillé (exclure Cash pour cette vue)
         df_credit_rated = df_credit[df_credit["Security Type"] != "Cash"]
-        poids_par_rating = (
-            df_credit_rated.groupby("S&P Ajusted")
+        # (catégorie ordonnée selon l'échelle S&P : le groupby sort déjà dans l'ordre)
+        credit_results['by_rating'] = (
+            df_credit_rated.groupby("S&P Ajusted", observed=True)
             .agg(
                 Market_Value=('Market Value (%)', 'sum'),
                 Number_of_positions=('Market Value (%)', 'count')
@@ -244,14 +304,6 @@ class PortfolioAnalyzer:
             .round(2)
         )
         
-        # Ordonner selon l'ordre S&P
-        poids_par_rating["S&P Ajusted"] = pd.Categorical(
-            poids_par_rating["S&P Ajusted"],
-            categories=self.calculator.ordre_sp,
-            ordered=True
-        )
-        credit_results['by_rating'] = poids_par_rating.sort_values("S&P Ajusted").reset_index(drop=True)
-        
         # 3. Exposition par émetteur (Top 10) - exclure Cash
         credit_results['by_issuer'] = (
             df_credit_rated.groupby("Issuer")["Market Value (%)"]
@@ -273,9 +325,9 @@ class PortfolioAnalyzer:
             .round(2)
         )
 
-        # Vue détaillée par bucket ET rating
+        # Vue détaillée par bucket ET rating (triée par bucket puis ordre S&P)
         credit_results['by_maturity_rating'] = (
-            df_credit.groupby(['Maturity_Bucket', 'S&P Ajusted'])
+            df_credit.groupby(['Maturity_Bucket', 'S&P Ajusted'], observed=True)
             .agg(
                 Market_Value=('Market Value (%)', 'sum'),
                 Number_of_positions=('Market Value (%)', 'count')
@@ -283,16 +335,15 @@ class PortfolioAnalyzer:
             .reset_index()
             .round(2)
         )
-
-        # Ordonner les ratings dans la vue détaillée
-        credit_results['by_maturity_rating']["S&P Ajusted"] = pd.Categorical(
-            credit_results['by_maturity_rating']["S&P Ajusted"],
-            categories=self.calculator.ordre_sp + ['CASH'],
-            ordered=True
-        )
-        credit_results['by_maturity_rating'] = credit_results['by_maturity_rating'].sort_values(
-            ['Maturity_Bucket', 'S&P Ajusted']
-        )
+        
+        # Tableaux numpy des graphiques (la vue détaillée reste un DataFrame pour la heatmap)
+        for cle, colonne_label, colonne_valeur in [
+            ('by_category', "Credit Category", "Market_Value"),
+            ('by_rating', "S&P Ajusted", "Market_Value"),
+            ('by_issuer', "Issuer", "Market Value (%)"),
+            ('by_maturity', "Maturity_Bucket", "Market_Value"),
+        ]:
+            credit_results[cle] = self._preparer_graphique(credit_results[cle], colonne_label, colonne_valeur)
 
         logger.info("Métriques crédit calculées")
 
@@ -1,9 +1,67 @@
+import math
+import numpy as np
 import pandas as pd
 from logger_config import get_logger
 
 #Initialisation du logger (gestion des erreurs)
 logger = get_logger(__name__)
 
+# Valeurs de rating considérées comme absentes (comparées en majuscules)
+RATINGS_INVALIDES = ["", "NR", "#N/A", "NAN", "NONE"]
+
+# Colonnes de faible cardinalité stockées en catégories (groupby sur codes entiers)
+COLONNES_CATEGORIELLES = [
+    "Security Type", "Industry Sector", "Cntry (Risk)", "S&P", "Theme", "Style", "REGION", "Credit Category"
+]
+
+# Corrections manuelles par ISIN : {ISIN: {colonne: valeur}}
+CORRECTIONS_MANUELLES = {
+    'US06744EDH71': {'Short Name': 'MICROSOFT', 'Sector': 'Technology', 'Cntry (Risk)': 'US',
+                     'Eqty Ticker': 'MSFT US'},
+    'US29446YAC03': {'Eqty Ticker': 'EQX US'},
+    'FR001400R1R6': {'Cntry (Risk)': 'FR'},
+    'FR001400M9F9': {'Cntry (Risk)': 'FR'},
+}
+
+# Colonnes d'entrée des sensibilités, dans l'ordre de dépaquetage de _calculate_sensitivities
+COLONNES_SENSIBILITE = [
+    "Market Value (%)", "Delta", "% Prem", "Delta (%)", "Premium (%)", "Mod Dur to Worst",
+    "Effective Duration", "Interest Sensitivity", "Credit Sensitivity", "Implied Spread"
+]
+
+# Colonnes produites par _calculate_sensitivities, dans l'ordre d'empilement
+COLONNES_CONTRIBUTION = [
+    "SENSI EQUITY", "CONTRIB SENSI EQUITY", "SENSI EQUITY XCV", "CONTRIB SENSI EQUITY XCV",
+    "contrib_modified_duration", "contrib_effective_duration", "contrib_taux_sensi",
+    "contrib_credit_sensi", "contrib_implied_spread"
+]
+
+
+def _remplacer_nan(valeurs: np.ndarray) -> np.ndarray:
+    """Équivalent numpy de fillna(0)"""
+    return np.where(np.isnan(valeurs), 0.0, valeurs)
+
+
+def _mapper_par_codes(serie: pd.Series, correspondance: dict) -> pd.Series:
+    """Équivalent de Series.map(dict) : un accès au dict par modalité, puis indexation par les codes"""
+    codes, modalites = pd.factorize(serie)
+    table = np.array([correspondance.get(m, np.nan) for m in modalites] + [np.nan], dtype=object)
+    return pd.Series(table[codes], index=serie.index)
+
+
+def _assigner_buckets(serie: pd.Series, bornes: np.ndarray, labels: list,
+                      droite: bool = False, inclure_min: bool = False) -> pd.Categorical:
+    """Équivalent de pd.cut par recherche dichotomique sur des bornes précalculées
+    
+    Intervalles [a, b[ par défaut, ]a, b] si droite ; hors bornes et NaN -> NaN
+    """
+    valeurs = serie.to_numpy(dtype=float)
+    codes = np.searchsorted(bornes, valeurs, side="left" if droite else "right") - 1
+    if inclure_min:
+        codes[valeurs == bornes[0]] = 0
+    codes[(codes < 0) | (codes >= len(labels))] = -1
+    return pd.Categorical.from_codes(codes, categories=labels, ordered=True)
+
 class PortfolioCalculator:
     """Calculateur des métriques de portefeuille"""
  
@@ -16,6 +74,8 @@ class PortfolioCalculator:
             "CC": 20, "C": 21, "D": 22
         }
 
+        self.number_to_sp_rating = {v: k for k, v in self.sp_rating_to_number.items() if v != 99}
+        self.note_min, self.note_max = min(self.number_to_sp_rating), max(self.number_to_sp_rating)
        
         self.ordre_sp = [
             "AAA", "AAA-", "AA+", "AA", "AA-", "A+", "A", "A-", 
@@ -34,6 +94,14 @@ class PortfolioCalculator:
             "Open-End Funds": 0, "Warrants": 1, "Cash": 0
         }
         
+        # Bornes et libellés des buckets (sensibilité, volatilité, maturité)
+        self.bornes_sensi = np.array([0, 0.25, 0.50, 0.75, 1.1])
+        self.labels_sensi = ["Bucket 0-25", "Bucket 25-50", "Bucket 50-75", "Bucket 75-100"]
+        self.bornes_vol = np.array([-np.inf, 20, 30, 40, np.inf])
+        self.labels_vol = ['<20%', '20-30%', '30-40%', '>40%']
+        self.bornes_maturite = np.array([-np.inf, 1, 3, 5, np.inf])
+        self.labels_maturite = ['<1 An', '1 à 3 Ans', '3 à 5 Ans', '>5 Ans']
+        
         self.pays_vers_region = {
             "BE": "Europe", "CA": "America", "CN": "Asia Ex-Jap", "DE": "Europe",
             "ES": "Europe", "FR": "Europe", "GB": "Europe", "IT": "Europe",
@@ -63,7 +131,8 @@ class PortfolioCalculator:
         """Calcule toutes les métriques du portefeuille"""
         logger.info("Début des calculs de métriques")
         
-        df = df.copy()
+        # Copie superficielle : les colonnes sont remplacées, pas modifiées sur place
+        df = df.copy(deep=False)
         
         # Applications des corrections manuelles
         df = self._apply_manual_corrections(df)
@@ -77,6 +146,9 @@ class PortfolioCalculator:
         # Calculs des buckets
         df = self._calculate_buckets(df)
         
+        # Calculs des buckets de maturity (à la suite des autres buckets)
+        df = self._calculate_maturity_buckets(df)
+        
         # Calculs des régions
         df = self._calculate_regions(df)
 
@@ -86,9 +158,8 @@ class PortfolioCalculator:
          # Calculs des styles
         df = self._calculate_style(df)
 
-         # Calculs des buckets de maturity
-        df = self._calculate_maturity_buckets(df)
-
+        # Colonnes de faible cardinalité en catégories
+        df = self._convert_categories(df)
         
     
         logger.info("Calculs de métriques terminés")
@@ -97,37 +168,27 @@ class PortfolioCalculator:
     
     def _apply_manual_corrections(self, df: pd.DataFrame) -> pd.DataFrame:
         """Applique les corrections manuelles spécifiques"""
-        # Corrections pour des ISIN spécifiques
-        df.loc[df['ISIN'] == 'US06744EDH71', ['Short Name', 'Sector', 'Cntry (Risk)']] = ['MICROSOFT', 'Technology', 'US']
-        df.loc[df['ISIN'] == 'US06744EDH71', 'Eqty Ticker'] = 'MSFT US'
-        df.loc[df['ISIN'] == 'US29446YAC03', 'Eqty Ticker'] = 'EQX US'
-        df.loc[df['ISIN'].isin(['FR001400R1R6', 'FR001400M9F9']), 'Cntry (Risk)'] = 'FR'
+        # Un seul passage sur la colonne ISIN ; chaque correction ne compare que les lignes trouvées
+        masque = df['ISIN'].isin(list(CORRECTIONS_MANUELLES)).to_numpy(dtype=bool, na_value=False)
+        positions = np.flatnonzero(masque)
+        isin_trouves = df['ISIN'].to_numpy()[positions]
+        
+        # Seules colonnes modifiées sur place : copiées pour ne pas toucher le DataFrame d'origine
+        if len(positions):
+            colonnes = [c for c in dict.fromkeys(c for corr in CORRECTIONS_MANUELLES.values() for c in corr)
+                        if c in df.columns]
+            df[colonnes] = df[colonnes].copy()
+        for isin, corrections in CORRECTIONS_MANUELLES.items():
+            lignes = np.zeros(len(df), dtype=bool)
+            lignes[positions[isin_trouves == isin]] = True
+            df.loc[lignes, list(corrections)] = list(corrections.values())
 
         return df
 
-    def _is_valid_rating(self, val) -> bool:
-        """Vérifie si une valeur de rating est valide"""
-        if pd.isna(val):
-            return False
-        val_str = str(val).strip().upper()
-        return val_str not in ["", "NR", "#N/A", "NAN", "NONE"]
-    
-    def _assign_rating_improved(self, row) -> str:
-        """Assigne un rating en suivant une logique de priorité robuste"""
-        # Priorité 1 : S&P
-        if self._is_valid_rating(row["S&P"]):
-            return str(row["S&P"]).strip()
-        
-        # Priorité 2 : S&P LT Foreign Currency
-        if "S&P LT Foreign Currency Issuer Credit Rating" in row.index:
-            if self._is_valid_rating(row["S&P LT Foreign Currency Issuer Credit Rating"]):
-                return str(row["S&P LT Foreign Currency Issuer Credit Rating"]).strip()
-        
-        # Priorité 3 : Rating interne
-        if self._is_valid_rating(row["Rating"]):
-            return str(row["Rating"]).strip()
-        
-        return "NR"
+    def _nettoyer_rating(self, serie: pd.Series) -> pd.Series:
+        """Normalise une colonne de rating, les valeurs invalides passent à NA"""
+        serie = serie.astype("string").str.strip()
+        return serie.mask(serie.str.upper().isin(RATINGS_INVALIDES))
 
     
     def _calculate_ratings(self, df: pd.DataFrame) -> pd.DataFrame:
@@ -137,8 +198,14 @@ class PortfolioCalculator:
         logger.info("=== DIAGNOSTIC RATINGS AVANT TRAITEMENT ===")
         logger.info(f"S&P uniques: {df['S&P'].value_counts(dropna=False).to_dict()}")
         
-        # Application de la logique améliorée
-        df['S&P Ajusted'] = df.apply(self._assign_rating_improved, axis=1)
+        # Priorité : S&P, puis S&P LT Foreign Currency, puis rating interne
+        rating = self._nettoyer_rating(df["S&P"])
+        if "S&P LT Foreign Currency Issuer Credit Rating" in df.columns:
+            rating = rating.combine_first(
+                self._nettoyer_rating(df["S&P LT Foreign Currency Issuer Credit Rating"])
+            )
+        rating = rating.combine_first(self._nettoyer_rating(df["Rating"]))
+        df['S&P Ajusted'] = rating.fillna("NR")
 
         #  Assigner un rating spécial "CASH" aux liquidités
         df.loc[df['Security Type'] == 'Cash', 'S&P Ajusted'] = 'CASH'
@@ -157,31 +224,34 @@ class PortfolioCalculator:
             logger.debug(f"Détail NR:\n{detail_nr}")
         
         
-        df['Rating Chiffre'] = df['S&P Ajusted'].map(self.sp_rating_to_number)
+        df['Rating Chiffre'] = _mapper_par_codes(df['S&P Ajusted'], self.sp_rating_to_number).astype(float)
         
         """df['Credit Category'] = df['S&P Ajusted'].apply(
             lambda x: 'Investment Grade' if x in self.ig_ratings else 
                      ('High Yield' if x not in ['NR', 'D'] else 'Not Rated')
         )"""
 
-        df['Credit Category'] = df.apply(
-            lambda row: 'Cash' if row['Security Type'] == 'Cash' 
-            else ('Investment Grade' if row['S&P Ajusted'] in self.ig_ratings 
-              else ('High Yield' if row['S&P Ajusted'] not in ['NR', 'D'] 
-                    else 'Not Rated')),
-            axis=1
+        # Catégorie crédit : la première condition vérifiée l'emporte
+        est_cash = df['Security Type'].eq('Cash').to_numpy(dtype=bool, na_value=False)
+        est_ig = df['S&P Ajusted'].isin(self.ig_ratings).to_numpy(dtype=bool, na_value=False)
+        est_non_note = df['S&P Ajusted'].isin(['NR', 'D']).to_numpy(dtype=bool, na_value=False)
+        df['Credit Category'] = np.select(
+            [est_cash, est_ig, ~est_non_note],
+            ['Cash', 'Investment Grade', 'High Yield'],
+            default='Not Rated'
         )
         
-        # Filtrer pour le calcul du rating du fonds
-        df_filtre = df[df["Security Type"].isin(["Corporate Bonds", "Convertible Bonds"])].copy()
-        df_filtre["Contrib Rating Chiffre"] = (
-            df_filtre['Rating Chiffre'] * df_filtre["Market Value (%)"] / 100
-        )
+        # Rating moyen des obligations pondéré par le poids (lignes sans rating chiffré ignorées)
+        est_obligation = df["Security Type"].isin(["Corporate Bonds", "Convertible Bonds"]).to_numpy(
+            dtype=bool, na_value=False)
+        notes = df['Rating Chiffre'].to_numpy(dtype=float)
+        poids = df["Market Value (%)"].to_numpy(dtype=float)
+        retenu = est_obligation & ~np.isnan(notes) & ~np.isnan(poids)
+        rating_chiffre = float(np.dot(notes[retenu], poids[retenu])) / 100.0
         
-        rating_chiffre = df_filtre["Contrib Rating Chiffre"].sum()
-        number_to_sp_rating = {v: k for k, v in self.sp_rating_to_number.items() if v != 99}
-        closest_number = min(number_to_sp_rating.keys(), key=lambda x: abs(x - rating_chiffre))
-        self.rating_final = number_to_sp_rating[closest_number]
+        # Notes entières contiguës : la plus proche par arrondi (à égalité, la meilleure note)
+        closest_number = min(max(math.ceil(rating_chiffre - 0.5), self.note_min), self.note_max)
+        self.rating_final = self.number_to_sp_rating[closest_number]
         
         logger.info(f"Rating S&P du fonds: {self.rating_final}")
         
@@ -189,16 +259,11 @@ class PortfolioCalculator:
 
     def _calculate_maturity_buckets(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calcule les buckets de maturité pour l'analyse crédit"""
-        df['Years to Mat'] = df.apply(
-        lambda row: 0.003 if row['Security Type'] == 'Cash' else row['Years to Mat'],
-        axis=1
-        )
+        # Maturité quasi nulle pour les liquidités
+        est_cash = df['Security Type'].eq('Cash').to_numpy(dtype=bool, na_value=False)
+        df['Years to Mat'] = df['Years to Mat'].mask(est_cash, 0.003)
         
-        bins_mat = [float('-inf'), 1, 3, 5, float('inf')]
-        labels_mat = ['<1 An', '1 à 3 Ans', '3 à 5 Ans', '>5 Ans']
-        df['Maturity_Bucket'] = pd.cut(
-            df['Years to Mat'], bins=bins_mat, labels=labels_mat, right=False
-        )
+        df['Maturity_Bucket'] = _assigner_buckets(df['Years to Mat'], self.bornes_maturite, self.labels_maturite)
         return df 
             
     
@@ -206,95 +271,60 @@ class PortfolioCalculator:
     def _calculate_sensitivities(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calcule toutes les sensibilités"""
         
-        # Sensibilité Equity
-        df["Delta"] = df.apply(
-            lambda row: self.delta_par_defaut.get(row["Security Type"], row["Delta"]) 
-            if pd.isna(row["Delta"]) else row["Delta"],
-            axis=1
-        )
-        
-        df["SENSI EQUITY"] = df["Delta"] / (1 + (df["% Prem"] / 100))
-        df["CONTRIB SENSI EQUITY"] = (
-            df["SENSI EQUITY"].fillna(0) * df["Market Value (%)"].fillna(0)
-        )
-        
-        # Sensibilité Equity XCV
-        df["Delta (%)"] = df.apply(
-            lambda row: self.delta_par_defaut.get(row["Security Type"], row["Delta (%)"]) 
-            if pd.isna(row["Delta (%)"]) else row["Delta (%)"],
-            axis=1
-        )
-        
-        df["SENSI EQUITY XCV"] = df["Delta (%)"] / (1 + (df["Premium (%)"] / 100))
-        df["CONTRIB SENSI EQUITY XCV"] = (
-            df["SENSI EQUITY XCV"].fillna(0) * df["Market Value (%)"].fillna(0)
-        )
-        
-        # Agrégation Duration du fonds
-        df["contrib_modified_duration"] = ( df["Mod Dur to Worst"] *df["Market Value (%)"] / 100 )
-        
-        # Agrégation  Effective Duration via XCV
-        # Step 1 : Remplacer les valeurs manquantes pour les non-convertibles
-        df["Effective Duration"] = df.apply(
-            lambda row: row["Mod Dur to Worst"]   if row["Security Type"] != "Convertible Bonds" else row["Effective Duration"],
-            axis=1
-        )
-        #step 2 : calculer la contrib
-        df["contrib_effective_duration"] = ( df["Effective Duration"] * df["Market Value (%)"] / 100 )
-        
-        
-        # Sensibilité Taux
-        df["Interest Sensitivity"] = df.apply(
-            lambda row: (row["OAD"] * -1) if row["Security Type"] != "Convertible Bonds" 
-            else row["Interest Sensitivity"], axis=1
-        )
-        
-        df["contrib_taux_sensi"] = (
-            df["Interest Sensitivity"] * df["Market Value (%)"] / 100
+        # Delta par défaut selon le type de titre, pour les deltas manquants
+        delta_defaut = _mapper_par_codes(df["Security Type"], self.delta_par_defaut).astype(float)
+        est_convertible = df["Security Type"].eq("Convertible Bonds").to_numpy(dtype=bool, na_value=False)
+
+        # Deltas equity et equity XCV
+        df["Delta"] = df["Delta"].astype(float).fillna(delta_defaut)
+        df["Delta (%)"] = df["Delta (%)"].astype(float).fillna(delta_defaut)
+        
+        # Hors convertibles : duration et sensibilités taux/crédit issues des données obligataires
+        df["Effective Duration"] = df["Effective Duration"].astype(float).where(est_convertible, df["Mod Dur to Worst"])
+        df["Interest Sensitivity"] = np.where(
+            est_convertible, df["Interest Sensitivity"].to_numpy(dtype=float), -df["OAD"].to_numpy(dtype=float)
         )
-        
-        # Sensibilité Crédit 
-        df["Credit Sensitivity"] = df.apply(
-            lambda row: (row["OAC"] * -1) if row["Security Type"] != "Convertible Bonds" 
-            else row["Credit Sensitivity"], axis=1
+        df["Credit Sensitivity"] = np.where(
+            est_convertible, df["Credit Sensitivity"].to_numpy(dtype=float), -df["OAC"].to_numpy(dtype=float)
         )
         
-        df["contrib_credit_sensi"] = (
-            df["Credit Sensitivity"] * df["Market Value (%)"] / 100
-        )
-
-        df["contrib_implied_spread"] = ( df["Implied Spread"] * df["Market Value (%)"] / 100 )
+        # Extraction unique des colonnes d'entrée, puis toutes les contributions en un passage
+        (mv, delta, prem, delta_xcv, prem_xcv, mod_dur, eff_dur,
+         sensi_taux, sensi_credit, spread) = df[COLONNES_SENSIBILITE].to_numpy(dtype=np.float64).T
+        poids = mv / 100
+        mv_rempli = _remplacer_nan(mv)
+        sensi_equity = delta / (1 + prem / 100)
+        sensi_equity_xcv = delta_xcv / (1 + prem_xcv / 100)
+        
+        df[COLONNES_CONTRIBUTION] = np.column_stack([
+            sensi_equity,
+            _remplacer_nan(sensi_equity) * mv_rempli,
+            sensi_equity_xcv,
+            _remplacer_nan(sensi_equity_xcv) * mv_rempli,
+            mod_dur * poids,
+            eff_dur * poids,
+            sensi_taux * poids,
+            sensi_credit * poids,
+            spread * poids,
+        ])
           
         return df
     
     def _calculate_buckets(self, df: pd.DataFrame) -> pd.DataFrame:
-        """Calcule les buckets (sensibilité, volatilité, maturité)"""
+        """Calcule les buckets (sensibilité, volatilité) ; maturité dans _calculate_maturity_buckets"""
         # Buckets de sensibilité equity
-        bins_equity = [0, 0.25, 0.50, 0.75, 1.1]
-        labels_equity = ["Bucket 0-25", "Bucket 25-50", "Bucket 50-75", "Bucket 75-100"]
-        df["SENSI BUCKET"] = pd.cut(
-            df["SENSI EQUITY"], bins=bins_equity, labels=labels_equity, include_lowest=True
+        df["SENSI BUCKET"] = _assigner_buckets(
+            df["SENSI EQUITY"], self.bornes_sensi, self.labels_sensi, droite=True, inclure_min=True
         )
         
         # Buckets de volatilité
-        bins_vol = [float('-inf'), 20, 30, 40, float('inf')]
-        labels_vol = ['<20%', '20-30%', '30-40%', '>40%']
-        df['Vol_Bucket'] = pd.cut(
-            df['Implied Volatility'], bins=bins_vol, labels=labels_vol, right=False
-        )
-        
-        # Buckets de maturité
-        bins_mat = [float('-inf'), 1, 3, 5, float('inf')]
-        labels_mat = ['<1 An', '1 à 3 Ans', '3 à 5 Ans', '>5 Ans']
-        df['Maturity_Bucket'] = pd.cut(
-            df['Years to Mat'], bins=bins_mat, labels=labels_mat, right=False
-        )
+        df['Vol_Bucket'] = _assigner_buckets(df['Implied Volatility'], self.bornes_vol, self.labels_vol)
         
         return df
     
     def _calculate_regions(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calcule les régions à partir des pays"""
-        df["REGION"] = df["Cntry (Risk)"].map(self.pays_vers_region)
+        df["REGION"] = _mapper_par_codes(df["Cntry (Risk)"], self.pays_vers_region)
         
         # Vérifier les codes non mappés
         codes_non_reconnus = df[df["REGION"].isna()]["Cntry (Risk)"].unique()
@@ -305,13 +335,13 @@ class PortfolioCalculator:
 
     def _calculate_asset(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calcule les asset types"""
-        contrib_by_security = df.groupby("Security Type")["Market Value (%)"].sum().reset_index().round(2)
+        contrib_by_security = df.groupby("Security Type", observed=True)["Market Value (%)"].sum().reset_index().round(2)
 
         return df
 
     def _calculate_style(self, df: pd.DataFrame) -> pd.DataFrame:
         """Calcule les styles à partir des secteurs"""
-        df["Style"] = df["Industry Sector"].map(self.Sector_vers_Style)
+        df["Style"] = _mapper_par_codes(df["Industry Sector"], self.Sector_vers_Style)
         
         # Vérifier les codes non mappés
         codes_non_reconnus = df[df["Style"].isna()]["Industry Sector"].unique()
@@ -319,3 +349,15 @@ class PortfolioCalculator:
             logger.warning(f"Pays non mappés: {codes_non_reconnus}")
         
         return df
+
+    def _convert_categories(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Convertit les colonnes de faible cardinalité en catégories"""
+        for colonne in COLONNES_CATEGORIELLES:
+            df[colonne] = df[colonne].astype("category")
+
+        # Ratings ordonnés selon l'échelle S&P, valeurs hors échelle ajoutées en fin
+        ordre = self.ordre_sp + ["CASH"]
+        hors_echelle = sorted(set(df["S&P Ajusted"].dropna().unique()) - set(ordre))
+        df["S&P Ajusted"] = df["S&P Ajusted"].astype(pd.CategoricalDtype(ordre + hors_echelle, ordered=True))
+
+        return df